@@ -19,6 +19,7 @@ from .const import (
     CONF_GATEWAY_ID,
     CONF_REMOTE_ID,
     DOMAIN,
+    PACKET_LOG_FILE,
 )
 
 PLATFORMS = [Platform.FAN, Platform.SENSOR, Platform.BINARY_SENSOR]
@@ -59,7 +60,9 @@ async def _setup_coordinator(
         if unsub:
             unsub()
 
-    unsub = coordinator.async_add_listener(_device_discovered)
+    unsub = coordinator.async_add_listener(
+        _device_discovered, frozenset({discover_key})
+    )
     return coordinator
 
 
@@ -116,6 +119,7 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
             remote_id=entry.runtime_data.config.remote_id,
             fan_id=entry.runtime_data.config.fan_id,
             co2_id=entry.runtime_data.config.co2_id,
+            packet_log_path=hass.config.path(PACKET_LOG_FILE),
         )
     except ConfigEntryNotReady:
         raise
@@ -123,6 +127,7 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         raise PlatformNotReady(f"RamsesESP: {e}")
 
     entry.runtime_data.ramses_esp = ramses_esp
+    entry.runtime_data.cleanup.append(ramses_esp.cleanup)
 
     dh = DataHandlers(hass, entry)
     for code, func in dh.pointers.items():
@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import statistics
+import tempfile
+import timeit
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from functools import partial
+from typing import Any
+
+from .code_schema import CodeValues, Value
+from .codes import CODES, Code22f1
+from .packet_log import PacketLog
+from .ramses_packet import RamsesID, RamsesPacket, RamsesPacketResponse
+from .ramses_packet_queue import RamsesPacketQueue
+
+_LOGGER = logging.getLogger(__name__)
+
+GATEWAY = RamsesID("18:149960")
+FAN = RamsesID("29:224547")
+CO2 = RamsesID("29:099029")
+REMOTE = RamsesID("29:163058")
+
+# One captured frame per code, from an MVS-15 with CO2 sensor and RF15 remote
+FRAMES = {
+    "042F": "064  I --- 29:224547 --:------ 29:224547 042F 006 000002000200",
+    "1060": "065  I --- 37:123456 --:------ 37:123456 1060 006 00C8000000FF",
+    "10E0": "051 RP --- 29:224547 18:149960 --:------ 10E0 039 "
+    "000001C8410D0100FFFFFFFFFFFF0D0407E3564D492D313552534C203032000000000000000000",
+    "10E1": "051 RP --- 29:224547 18:149960 --:------ 10E1 004 00736CA3",
+    "1298": "060  I --- 29:099029 --:------ 29:099029 1298 003 00049E",
+    "12A0": "044 RP --- 29:224547 18:149960 --:------ 12A0 002 002F",
+    "1FC9": "050  I --- 29:163058 --:------ 29:163058 1FC9 006 0022F175FF32",
+    "22F1": "045  I --- 29:163058 29:224547 --:------ 22F1 003 000304",
+    "22F3": "045  I --- 29:163058 29:224547 --:------ 22F3 007 00020F03040000",
+    "31D9": "062  I --- 29:224547 --:------ 29:224547 31D9 003 000004",
+    "31E0": "067  I --- 29:099029 29:224547 --:------ 31E0 008 0000590000006400",
+}
+TS = "2025-06-01T17:10:49.271376+02:00"
+QUEUE_DEPTHS = (1, 10, 100, 1000)
+
+
+class BenchmarkException(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Benchmark:
+    name: str
+    func: Callable[[], object]
+    ops: int = 1  # operations per call of func
+
+
+def _parsed(frame: str) -> RamsesPacket:
+    packet = RamsesPacket(envelope={"ts": TS, "msg": frame})
+    packet.parse()
+    return packet
+
+
+def _decode_all(values: type[CodeValues], data: str) -> dict[str, Value]:
+    return values(data).as_dict()
+
+
+def _envelope_benchmarks() -> Iterator[Benchmark]:
+    envelope = {"ts": TS, "msg": FRAMES["31D9"]}
+    payload = json.dumps(envelope)
+    yield Benchmark("envelope.construct", partial(RamsesPacket, envelope=envelope))
+    yield Benchmark("envelope.parse", lambda: RamsesPacket(envelope=envelope).parse())
+    yield Benchmark(
+        "envelope.from_payload", partial(RamsesPacket.from_payload, payload)
+    )
+
+
+def _codec_benchmarks() -> Iterator[Benchmark]:
+    for code, frame in FRAMES.items():
+        decoder = CODES.decoder(code)
+        packet = _parsed(frame)
+        decoder(packet=packet)  # fails here rather than in the middle of a run
+        yield Benchmark(f"decode.{code}", partial(decoder, packet=packet))
+        yield Benchmark(  # every field, without the DecodeCache
+            f"decode.payload.{code}", partial(_decode_all, decoder._values, packet.data)
+        )
+    for info in CODES:
+        if info.requestable:
+            yield Benchmark(
+                f"encode.get.{info.code}",
+                partial(info.decoder.get, src_id=GATEWAY, dst_id=FAN),
+            )
+    for mode in ("Low", "High (15m)"):  # 22F1 and 22F3
+        yield Benchmark(
+            f"encode.set.{mode}",
+            partial(Code22f1.set, value=mode, src_id=REMOTE, dst_id=FAN),
+        )
+
+
+def _request(i: int, code: str) -> RamsesPacket:
+    packet = RamsesPacket(
+        src_id=GATEWAY,
+        dst_id=RamsesID(f"29:{i:06d}"),
+        type="RQ",
+        code=code,
+        data="00",
+    )
+    packet.expected_response = RamsesPacketResponse(
+        src_id=packet.dst_id, dst_id=GATEWAY, type="RP", code=code
+    )
+    return packet
+
+
+def _queue_benchmarks() -> Iterator[Benchmark]:
+    codes = ["10E0", "12A0", "1298", "31D9", "31E0"]
+    for depth in QUEUE_DEPTHS:
+        q = RamsesPacketQueue()
+        for i in range(depth):
+            q.add(_request(i // len(codes), codes[i % len(codes)]))
+        last = _request(depth, "12A0")
+        q.add(last)
+        hit = _parsed(f"045 RP --- {last.dst_id} 18:149960 --:------ 12A0 002 002F")
+        miss = _parsed(FRAMES["31D9"])
+        assert q.get(hit) is last and q.get(miss) is None
+        extra = _request(depth + 1, "12A0")
+
+        def add_remove(q: RamsesPacketQueue = q, p: RamsesPacket = extra) -> None:
+            q.add(p)
+            q.remove(p)
+
+        yield Benchmark(f"queue.add_remove.{depth}", add_remove)
+        yield Benchmark(f"queue.get_hit.{depth}", partial(q.get, hit))
+        yield Benchmark(f"queue.get_miss.{depth}", partial(q.get, miss))
+
+
+def _packet_log_benchmarks() -> Iterator[Benchmark]:
+    lines = [f"{TS} {frame}" for frame in FRAMES.values()] * 1000
+    with tempfile.TemporaryDirectory(prefix="orcon_bench_") as tmp:
+        path = os.path.join(tmp, "packet.log")
+
+        def write_all() -> None:
+            """Until it's on disk, so the writer thread's share is included"""
+            log = PacketLog.open(
+                path,
+                max_size=50_000_000,
+                backups=1,
+                compression=None,
+                max_queued=len(lines),
+            )
+            for line in lines:
+                log.write(line)
+            log.close()
+            log._thread.join()
+            if log.dropped:
+                raise BenchmarkException(f"packet_log dropped {log.dropped} lines")
+
+        yield Benchmark("packet_log.write", write_all, ops=len(lines))
+
+
+def _dispatch_benchmarks() -> Iterator[Benchmark]:
+    """_handle_ramses_packet with no-op handlers, needs Home Assistant for RamsesESP"""
+    try:
+        from homeassistant.core import HomeAssistant
+
+        from .ramses_esp import RamsesESP
+        from .replay import ReplayMQTT
+    except ImportError as e:
+        _LOGGER.warning(f"Skipping the dispatch benchmarks: {e}")
+        return
+
+    async def core(config_dir: str) -> HomeAssistant:
+        return HomeAssistant(config_dir)
+
+    loop = asyncio.new_event_loop()
+    with tempfile.TemporaryDirectory(prefix="orcon_bench_") as config_dir:
+        hass = loop.run_until_complete(core(config_dir))
+        esp = RamsesESP(
+            hass,
+            ReplayMQTT(hass, GATEWAY),
+            remote_id=REMOTE,
+            fan_id=FAN,
+            co2_id=CO2,
+            gateway_id=GATEWAY,
+            packet_log_path=os.path.join(config_dir, "packet.log"),
+            dedup_clock=itertools.count(step=10).__next__,  # no RF repeats
+        )
+        for code in FRAMES:
+            esp.add_handler(code, lambda payload: None)
+        own = [
+            {"ts": TS, "msg": frame}
+            for frame in FRAMES.values()
+            if frame[11:20] in (FAN, CO2, REMOTE)
+        ]
+        foreign = [{"ts": TS, "msg": FRAMES["1060"]}]
+
+        async def handle(envelopes: list[dict[str, str]]) -> None:
+            for envelope in envelopes:
+                await esp._handle_ramses_packet(RamsesPacket(envelope=envelope))
+
+        yield Benchmark(
+            "dispatch.admitted",
+            lambda: loop.run_until_complete(handle(own * 100)),
+            ops=len(own) * 100,
+        )
+        yield Benchmark(
+            "dispatch.foreign",
+            lambda: loop.run_until_complete(handle(foreign * 100)),
+            ops=100,
+        )
+        esp.cleanup()
+        loop.run_until_complete(hass.async_stop(force=True))
+    loop.close()
+
+
+GROUPS = (
+    _envelope_benchmarks,
+    _codec_benchmarks,
+    _queue_benchmarks,
+    _packet_log_benchmarks,
+    _dispatch_benchmarks,
+)
+
+
+def measure(benchmark: Benchmark, repeat: int = 5) -> dict[str, float]:
+    """Best and median ns per operation over repeat runs of at least 0.2s each"""
+    timer = timeit.Timer(benchmark.func)
+    number, _ = timer.autorange()
+    per_op = [t / number / benchmark.ops * 1e9 for t in timer.repeat(repeat, number)]
+    return {
+        "ns_per_op": round(min(per_op), 1),
+        "median_ns": round(statistics.median(per_op), 1),
+        "ops_per_s": round(1e9 / min(per_op)),
+    }
+
+
+def run(select: str = "", repeat: int = 5) -> dict[str, Any]:
+    """Run the benchmarks whose name contains select, results keyed on name"""
+    results = {}
+    for group in GROUPS:
+        for benchmark in group():
+            if select in benchmark.name:
+                results[benchmark.name] = measure(benchmark, repeat)
+                _LOGGER.info(f"{benchmark.name}: {results[benchmark.name]}")
+    return {
+        "created": datetime.now(UTC).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} {platform.processor()}",
+        "results": results,
+    }
+
+
+def compare(
+    report: dict[str, Any], baseline: dict[str, Any], threshold: float = 0.1
+) -> list[tuple[str, float, float, float, bool]]:
+    """(name, baseline ns, ns, change, regressed) of the benchmarks in both, change as a fraction"""
+    rows = []
+    for name, result in report["results"].items():
+        if (old := baseline["results"].get(name)) is None:
+            continue
+        change = result["ns_per_op"] / old["ns_per_op"] - 1
+        rows.append(
+            (name, old["ns_per_op"], result["ns_per_op"], change, change > threshold)
+        )
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    """Benchmark the hot paths: python -m custom_components.orcon_mvs15.benchmark"""
+
+    parser = argparse.ArgumentParser(description="Benchmark the protocol hot paths")
+    parser.add_argument("--select", default="", help="only names containing this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="save the results here")
+    parser.add_argument("--baseline", help="compare with results saved by --json")
+    parser.add_argument(
+        "--threshold", type=float, default=0.1, help="slowdown that fails, 0.1 = 10%%"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    report = run(args.select, args.repeat)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if not args.baseline:
+        for name, result in report["results"].items():
+            print(
+                f"{name:28} {result['ns_per_op']:12.1f} ns {result['ops_per_s']:12d} /s"
+            )
+        sys.exit(0)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    rows = compare(report, baseline, args.threshold)
+    for name, old, new, change, regressed in rows:
+        print(
+            f"{name:28} {old:12.1f} ns {new:12.1f} ns {change:+8.1%}"
+            f"{'  REGRESSED' if regressed else ''}"
+        )
+    sys.exit(1 if any(row[4] for row in rows) else 0)
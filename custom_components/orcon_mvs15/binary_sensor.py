@@ -8,11 +8,13 @@ from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import callback, HomeAssistant
 from homeassistant.helpers.device_registry import DeviceInfo
 from homeassistant.helpers.entity_platform import AddConfigEntryEntitiesCallback
-from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
 from .const import DOMAIN
 from .discover_entity import DiscoverEntity
-from .coordinator import OrconMVS15DataUpdateCoordinator
+from .coordinator import (
+    OrconMVS15CoordinatorEntity,
+    OrconMVS15DataUpdateCoordinator,
+)
 from .models import OrconMVS15Config
 from .ramses_esp import RamsesESP
 
@@ -36,7 +38,7 @@ async def async_setup_entry(
     entry.runtime_data.cleanup.append(fan_sensor.cleanup)
 
 
-class FaultBinarySensor(CoordinatorEntity, BinarySensorEntity):
+class FaultBinarySensor(OrconMVS15CoordinatorEntity, BinarySensorEntity):
     _attr_device_class = BinarySensorDeviceClass.PROBLEM
 
     def __init__(
@@ -49,7 +51,7 @@ class FaultBinarySensor(CoordinatorEntity, BinarySensorEntity):
         name: str,
         discovery_key: str,
     ) -> None:
-        super().__init__(coordinator)
+        super().__init__(coordinator, keys=(f"{discovery_key}_fault",))
         self.discovery_key = discovery_key
         self._attr_name = f"{name} fault"
         self._attr_unique_id = f"orcon_mvs15_{self.discovery_key}_fault_{ramses_id}"
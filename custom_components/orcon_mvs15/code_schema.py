@@ -0,0 +1,330 @@
+from __future__ import annotations
+
+import inspect
+import logging
+from collections import OrderedDict
+from collections.abc import Callable, Iterator, Mapping
+from dataclasses import dataclass, field
+from functools import partial
+from typing import ClassVar, cast
+
+from .ramses_packet import DEVICES, RamsesPacket, RamsesPacketDatetime
+
+_LOGGER = logging.getLogger(__name__)
+
+Value = str | int | float | bool | RamsesPacketDatetime | None
+Encoder = Callable[..., str]
+
+MAX_LENGTH = 255  # bytes, of a RAMSES II payload
+_UNSET = object()  # field not decoded yet
+
+
+class CodeSchemaException(Exception):
+    pass
+
+
+class CodeValues:
+    """Decoded payload, read-only
+
+    Subclasses declare the fields by annotating their types (and __slots__ =
+    ()), compile_values() derives the class a code actually uses: a slot and
+    a property per field, that decodes the field on first access."""
+
+    __slots__ = ("_data",)
+
+    _fields: ClassVar[tuple[str, ...]] = ()
+
+    def __init__(self, data: str) -> None:
+        self._data = data
+
+    def __repr__(self) -> str:
+        return ", ".join(f"{name}: {value}" for name, value in self.items())
+
+    def items(self) -> Iterator[tuple[str, Value]]:
+        """(name, value) of every field, in payload order"""
+        for name in self._fields:
+            yield name, getattr(self, name)
+
+    def as_dict(self) -> dict[str, Value]:
+        return dict(self.items())
+
+
+@dataclass(frozen=True)
+class Field:
+    """A value in the payload, offset and width in bytes (width None: to the end)
+
+    Types:
+      uint     unsigned big endian int, divided by scale (a float) unless it's 1,
+               raw values in none decode to None
+      percent  one byte in half percents, above 200 (FE/FF) is None
+      hex      the payload digits as is, after prefix
+      enum     hex digits looked up in enum, unknown ones are kept as is with
+               fallback "raw" or None with fallback None
+      flag     True if any bit in mask is set (invert: if none is)
+      device   device id (3 bytes), FFFFFF is blank and spaces are "--:------"
+      date     RamsesPacketDatetime
+      ascii    text up to the first NUL"""
+
+    name: str
+    offset: int
+    width: int | None = 1
+    type: str = "uint"
+    scale: float = 1
+    none: tuple[int, ...] = ()
+    prefix: str = ""
+    enum: Mapping[str, str] = field(default_factory=dict)
+    fallback: str | None = None
+    mask: int = 0xFF
+    invert: bool = False
+
+
+@dataclass(frozen=True)
+class Schema:
+    """Payload layout of a code, lengths are the valid payload lengths in bytes
+
+    values declares the fields with their types. Fields are only decoded
+    for payloads longer than 1 byte (requests carry no values), they're None
+    otherwise."""
+
+    label: str
+    values: type[CodeValues]
+    lengths: tuple[int | range, ...] = ()
+    fields: tuple[Field, ...] = ()
+
+    def valid_lengths(self) -> frozenset[int] | None:
+        """None if any length goes"""
+        if not self.lengths:
+            return None
+        valid: set[int] = set()
+        for length in self.lengths:
+            valid.update(length if isinstance(length, range) else (length,))
+        return frozenset(valid)
+
+
+def _device(digits: str) -> str:
+    if digits == "FFFFFF":  # aka '63:262143'
+        return f"{'':9}"
+    if not digits.strip():  # aka '--:------'
+        return "--:------"
+    return DEVICES.id(int(digits, 16), intern=False)
+
+
+def _unknown(code: str, name: str, digits: str) -> None:
+    if _LOGGER.isEnabledFor(logging.DEBUG):
+        _LOGGER.debug(f"Unknown {name} for {code}: {digits}")
+
+
+def _expression(code: str, i: int, f: Field, namespace: dict[str, object]) -> str:
+    """Python expression that decodes field f from the payload digits in data"""
+    end = None if f.width is None else 2 * (f.offset + f.width)
+    digits = f"data[{2 * f.offset}:{'' if end is None else end}]"
+    if f.type == "uint":
+        value = "v" if f.scale == 1 else f"v / {f.scale!r}"
+        if f.none:
+            namespace[f"_none{i}"] = frozenset(f.none)
+            return f"(None if (v := int({digits}, 16)) in _none{i} else {value})"
+        return (
+            f"int({digits}, 16)" if f.scale == 1 else f"int({digits}, 16) / {f.scale!r}"
+        )
+    if f.type == "percent":
+        return f"(None if (v := int({digits}, 16)) > 200 else v // 2)"
+    if f.type == "hex":
+        return f"{f.prefix!r} + {digits}" if f.prefix else digits
+    if f.type == "enum":
+        namespace[f"_enum{i}"] = dict(f.enum)
+        if f.fallback == "raw":
+            return f"_enum{i}.get(d := {digits}, d)"
+        namespace[f"_unknown{i}"] = partial(_unknown, code, f.name)
+        return f"(_enum{i}.get(d := {digits}) or _unknown{i}(d))"
+    if f.type == "flag":
+        if f.invert:
+            return f"not int({digits}, 16) & {f.mask}"
+        return f"bool(int({digits}, 16) & {f.mask})"
+    if f.type == "device":
+        if f.width != 3:
+            raise CodeSchemaException(f"{code}: device field {f.name} isn't 3 bytes")
+        return f"_device({digits})"
+    if f.type == "date":
+        return f"RamsesPacketDatetime({digits})"
+    if f.type == "ascii":
+        return f'bytes.fromhex({digits}).partition(b"\\0")[0].decode()'
+    raise CodeSchemaException(f"{code}: unknown type {f.type} of field {f.name}")
+
+
+def compile_values(code: str, schema: Schema) -> type[CodeValues]:
+    """Subclass of schema.values that decodes the fields of this code
+
+    Every field becomes a property, compiled from its schema entry, that
+    decodes the field from the payload digits once and keeps it in a slot."""
+    declared = schema.values.__mro__[:-2]  # not CodeValues and object
+    if any("__slots__" not in cls.__dict__ for cls in declared):
+        raise CodeSchemaException(f"{code}: {schema.values.__name__} needs __slots__")
+    annotated = {name for cls in declared for name in inspect.get_annotations(cls)}
+    names = tuple(f.name for f in schema.fields)
+    if annotated != set(names):
+        raise CodeSchemaException(
+            f"{code}: fields of {schema.values.__name__} don't match the schema"
+        )
+    namespace: dict[str, object] = {
+        "_UNSET": _UNSET,
+        "_device": _device,
+        "RamsesPacketDatetime": RamsesPacketDatetime,
+    }
+    source = (
+        f"def __init__(self, data):\n"
+        f"    self._data = data\n"
+        f"    self.{' = self.'.join(f'_{name}' for name in names)} = _UNSET\n"
+    )
+    for i, f in enumerate(schema.fields):
+        source += (
+            f"def {f.name}(self):\n"
+            f"    if (value := self._{f.name}) is _UNSET:\n"
+            f"        data = self._data\n"
+            f"        value = self._{f.name} = (\n"
+            f"            ({_expression(code, i, f, namespace)}) if len(data) > 2 else None\n"
+            f"        )\n"
+            f"    return value\n"
+        )
+    exec(compile(source, f"<schema {code}>", "exec"), namespace)  # noqa: S102  # our own source
+    return cast(
+        "type[CodeValues]",
+        type(
+            schema.values.__name__,
+            (schema.values,),
+            {
+                "__slots__": tuple(f"_{name}" for name in names),
+                "__module__": schema.values.__module__,
+                "__init__": namespace["__init__"],
+                "_fields": names,
+                **{name: property(namespace[name]) for name in names},  # type: ignore[arg-type]
+            },
+        ),
+    )
+
+
+class DecodeCache:
+    """Decoded payloads of one code, keyed on the payload, bounded in size (LRU)
+
+    Periodic broadcasts mostly repeat the previous payload, those are decoded
+    once. The values are shared by every packet that carried the payload, a
+    field decoded for one packet is decoded for all of them. The same object
+    coming back for a source means the payload didn't change since its
+    previous packet with this code."""
+
+    def __init__(self, values: type[CodeValues], max_size: int = 64) -> None:
+        self.values = values
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._decoded: OrderedDict[str, CodeValues] = OrderedDict()
+        self._last: dict[int, CodeValues] = {}
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(max_size={self.max_size}, size={len(self)})"
+
+    def __len__(self) -> int:
+        return len(self._decoded)
+
+    def decode(self, packet: RamsesPacket) -> tuple[CodeValues, bool]:
+        """Values of the packet's payload, and whether it's unchanged
+
+        Unchanged: same payload as the previous packet from this source, as
+        far as the cache remembers."""
+        data = packet.data
+        decoded = self._decoded
+        if (values := decoded.get(data)) is not None:
+            self.hits += 1
+            decoded.move_to_end(data)
+        else:
+            self.misses += 1
+            values = decoded[data] = self.values(data)
+            if len(decoded) > self.max_size:
+                decoded.popitem(last=False)
+        last = self._last
+        if last.get(src := packet.src) is values:
+            return values, True
+        if len(last) >= self.max_size:  # foreign devices, start over
+            last.clear()
+        last[src] = values
+        return values, False
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self), "hits": self.hits, "misses": self.misses}
+
+    def clear(self) -> None:
+        self._decoded.clear()
+        self._last.clear()
+
+
+def _setter(code: str, f: Field) -> Callable[[Value], bytes]:
+    """Specialised encoder of one field"""
+    width = f.width
+    if f.type == "uint":
+        scale, none = f.scale, f.none
+
+        def uint(value: Value) -> bytes:
+            if value is None and none:
+                return none[0].to_bytes(width or 1)
+            if not isinstance(value, (int, float)):
+                raise CodeSchemaException(f"{code}: {f.name} must be a number")
+            return (round(value * scale) if scale != 1 else int(value)).to_bytes(
+                width or 1
+            )
+
+        return uint
+    if f.type == "percent":
+
+        def percent(value: Value) -> bytes:
+            if value is None:
+                return b"\xff"
+            if not isinstance(value, (int, float)):
+                raise CodeSchemaException(f"{code}: {f.name} must be a number")
+            return bytes((int(value * 2),))
+
+        return percent
+    if f.type == "hex":
+        prefix = f.prefix
+        return lambda value: bytes.fromhex(str(value).removeprefix(prefix))
+    if f.type == "enum":
+        digits = {label: digits for digits, label in f.enum.items()}
+
+        def lookup(value: Value) -> bytes:
+            try:
+                return bytes.fromhex(digits[str(value)])
+            except KeyError:
+                raise CodeSchemaException(f"{code}: unknown {f.name} {value}")
+
+        return lookup
+    if f.type == "flag":
+        mask, invert = f.mask, f.invert
+        return lambda value: bytes((mask if bool(value) != invert else 0,))
+    if f.type == "device":
+        return lambda value: DEVICES.handle(str(value)).to_bytes(width or 3)
+    if f.type == "ascii":
+        return lambda value: str(value).encode() + b"\0"
+
+    def unsupported(value: Value) -> bytes:
+        raise CodeSchemaException(f"{code}: can't encode {f.type} field {f.name}")
+
+    return unsupported
+
+
+def compile_encoder(code: str, schema: Schema) -> Encoder:
+    """Encoder of payloads with this code, takes field values as keyword arguments
+
+    Returns the payload in hex, bytes of fields that aren't given are 00."""
+    setters = {f.name: (f.offset, _setter(code, f)) for f in schema.fields}
+
+    def encode(**values: Value) -> str:
+        payload = bytearray()
+        for name, value in values.items():
+            if (setter := setters.get(name)) is None:
+                raise CodeSchemaException(f"{code}: no field {name}")
+            offset, set_field = setter
+            raw = set_field(value)
+            if len(payload) < offset + len(raw):
+                payload.extend(bytes(offset + len(raw) - len(payload)))
+            payload[offset : offset + len(raw)] = raw
+        return payload.hex().upper()
+
+    return encode
@@ -2,14 +2,33 @@ from __future__ import annotations
 
 from .ramses_packet import (
     RamsesPacket,
-    RamsesPacketResponse,
     RamsesPacketDatetime,
+    RamsesPacketResponse,
     RamsesID,
 )
+from .code_schema import (
+    MAX_LENGTH,
+    CodeValues,
+    DecodeCache,
+    Encoder,
+    Field,
+    Schema,
+    compile_encoder,
+    compile_values,
+)
 
 import logging
 
+from collections import Counter
+from collections.abc import Iterator
+from dataclasses import dataclass, replace
+
 __all__ = [
+    "CODES",
+    "BatteryState",
+    "CO2Level",
+    "CodeInfo",
+    "CodeRegistry",
     "Code",
     "Code042f",
     "Code1060",
@@ -22,6 +41,14 @@ __all__ = [
     "Code22f3",
     "Code31d9",
     "Code31e0",
+    "DeviceID",
+    "DeviceInfo",
+    "FanMode",
+    "FanState",
+    "IndoorHumidity",
+    "PowerCycles",
+    "RFBind",
+    "VentDemand",
 ]
 
 _LOGGER = logging.getLogger(__name__)
@@ -31,55 +58,130 @@ class CodeException(Exception):
     pass
 
 
+@dataclass(frozen=True)
+class CodeInfo:
+    code: str
+    decoder: type[Code]
+    label: str
+    requestable: bool
+
+    def expected_length(self, length: int) -> bool:
+        return self.decoder._expected_length(length)
+
+
+class CodeRegistry:
+    """Maps a 4 hex digit code to its Code subclass, filled once on import"""
+
+    def __init__(self) -> None:
+        self._codes: dict[str, CodeInfo] = {}
+        self.unknown: Counter[str] = Counter()
+
+    def __contains__(self, code: str) -> bool:
+        return code in self._codes
+
+    def __iter__(self) -> Iterator[CodeInfo]:
+        return iter(self._codes.values())
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def register(self, cls: type[Code]) -> None:
+        self._codes[cls._code] = CodeInfo(
+            code=cls._code,
+            decoder=cls,
+            label=(cls.__doc__ or cls.__name__).splitlines()[0],
+            requestable=cls._requestable,
+        )
+
+    def lookup(self, code: str) -> CodeInfo | None:
+        """CodeInfo for code, None (and a warning the first time) if unknown"""
+        if (info := self._codes.get(code)) is not None:
+            return info
+        self.unknown[code] += 1
+        if self.unknown[code] == 1:
+            _LOGGER.warning(f"No decoder for code {code}")
+        return None
+
+    def cache_stats(self) -> dict[str, dict[str, int]]:
+        """DecodeCache size, hits and misses per code"""
+        return {
+            info.code: info.decoder._cache.stats()
+            for info in self
+            if info.decoder._cache is not None
+        }
+
+    def decoder(self, code: str) -> type[Code]:
+        """Code subclass for code, the generic Code if unknown"""
+        if (info := self.lookup(code)) is None:
+            return Code
+        return info.decoder
+
+
+CODES = CodeRegistry()
+
+
 class Code:
+    """Decoded packet, the payload layout of subclasses is declared in _schema
+
+    The schema is compiled once per class into _values (and _encode), packets
+    of a code without schema are shown as unsupported. values are shared by
+    all packets with the same payload (see DecodeCache in _cache), the signal
+    strength is the packet's own. unchanged is True if the previous packet
+    with this code from the same source had the same payload."""
+
     _code = "FFFF"
+    _requestable = True
+    _schema: Schema | None = None
+    _label = "Unsupported code"
+    _lengths: frozenset[int] | None = None
+    _values: type[CodeValues] = CodeValues
+    _encode: Encoder | None = None
+    _cache: DecodeCache | None = None
+
+    values: CodeValues
+
+    def __init_subclass__(cls, **kwargs: object) -> None:
+        super().__init_subclass__(**kwargs)
+        if cls._schema is not None:
+            cls._label = cls._schema.label
+            cls._lengths = cls._schema.valid_lengths()
+            cls._values = compile_values(cls._code, cls._schema)
+            cls._encode = staticmethod(compile_encoder(cls._code, cls._schema))
+            cls._cache = DecodeCache(cls._values)
+        CODES.register(cls)
 
     def __init__(self, packet: RamsesPacket) -> None:
         self.packet = packet
-        self.values: dict[str, str | int | bool | RamsesPacketDatetime | None] = {}
-        if self.packet:
-            self._validate_packet()
-            self._parse_packet()
-
-    def _expected_length(self, length: int) -> bool:
-        return True
-
-    def _percent(self, value: str) -> int | None:
-        if int(value, 16) > 200:  # FE or FF
-            return None
-        return int(value, 16) // 2
-
-    def _dev_hex_to_id(self, device_hex: str) -> str:
-        """Convert (say) '06368E' to '01:145038'"""
-        if device_hex == "FFFFFF":  # aka '63:262143'
-            return f"{'':9}"
-        if not device_hex.strip():  # aka '--:------'
-            return "--:------"
-        _tmp = int(device_hex, 16)
-        dev_type = (_tmp & 0xFC0000) >> 18
-        return f"{dev_type:02d}:{_tmp & 0x03FFFF:06d}"
-
-    def _validate_packet(self) -> None:
-        """Validate the RamsesPacket, raise CodeException if it fails"""
-        if not self._expected_length(self.packet.length):
-            raise CodeException(f"Unexpected length: {self.packet}")
-
-    def _parse_packet(self) -> None:
-        """Parse the RamsesPacket, put result in self.values"""
-        self.values = {"_label": "Unsupported code", "packet": str(self.packet)}
+        self.signal_strength: int | None = None
+        self.unchanged = False
+        if not packet:
+            self.values = self._values("")
+            return
+        if self._lengths is not None and packet.length not in self._lengths:
+            raise CodeException(f"Unexpected length: {packet}")
+        self.signal_strength = -packet.signal_strength
+        if self._cache is None:
+            self.values = self._values(packet.data)
+            return
+        self.values, self.unchanged = self._cache.decode(packet)
+
+    @classmethod
+    def _expected_length(cls, length: int) -> bool:
+        return cls._lengths is None or length in cls._lengths
 
     def __repr__(self) -> str:
-        """Return a human readable string of self.values"""
+        """Return a human readable string of the values"""
         if self.packet.length == 1:
-            return f"{self.values['_label']} state request"
-        keyval = ", ".join(
-            [f"{k}: {v}" for k, v in self.values.items() if not k.startswith("_")]
-        )
-        return f"{self.values['_label']}: {keyval}"
+            return f"{self._label} state request"
+        if self._cache is None:
+            return f"{self._label}: packet: {self.packet}"
+        return f"{self._label}: signal_strength: {self.signal_strength}, {self.values}"
 
     @classmethod
     def get(cls, src_id: RamsesID, dst_id: RamsesID) -> RamsesPacket:
         """Build a RamsesPacket object that requests the current status"""
+        if not cls._requestable:
+            raise NotImplementedError(f"{cls._code} can't be requested")
         p = RamsesPacket(
             src_id=src_id,
             dst_id=dst_id,
@@ -106,31 +208,36 @@ class Code:
         raise NotImplementedError
 
 
+class CO2Level(CodeValues):
+    __slots__ = ()
+
+    level: int | None
+
+
 class Code1298(Code):
     """CO2"""
 
     _code = "1298"
+    values: CO2Level
+    _schema = Schema(
+        label="CO2 level",
+        values=CO2Level,
+        lengths=(1, 3),
+        fields=(Field("level", 0, width=3),),
+    )
 
-    def _expected_length(self, length: int) -> bool:
-        return length in [1, 3]
 
-    def _parse_packet(self) -> None:
-        self.values = {
-            "_label": "CO2 level",
-            "signal_strength": -self.packet.signal_strength,
-            "level": None,
-        }
-        if self.packet.length == 3:
-            if self.packet.data:
-                self.values.update({"level": int(self.packet.data, 16)})
-            else:
-                self.values.update({"level": None})
+class FanMode(CodeValues):
+    __slots__ = ()
+
+    fan_mode: str | None
 
 
 class Code22f1(Code):
     """Fan mode, will act as 22F3 if needed"""
 
     _code = "22F1"
+    values: FanMode
 
     _fan_modes = {
         "Auto": "000404",
@@ -142,30 +249,30 @@ class Code22f1(Code):
         "High (60m)": "00023C03040000",
         "Away": "000004",
     }
-
-    def _expected_length(self, length: int) -> bool:
-        return length in [1, 3]
-
-    def _parse_packet(self) -> None:
-        self.values = {
-            "_label": "Fan mode",
-            "signal_strength": -self.packet.signal_strength,
-            "fan_mode": None,
-        }
-        if self.packet.length != 1:
-            for k, v in self._fan_modes.items():
-                if v == self.packet.data:
-                    self.values.update({"fan_mode": k})
-                    return
-            _LOGGER.debug(f"Unknown preset for 22F1/22F3: {self.packet.data}")
+    _schema = Schema(
+        label="Fan mode",
+        values=FanMode,
+        lengths=(1, 3),
+        fields=(
+            Field(
+                "fan_mode",
+                0,
+                width=None,
+                type="enum",
+                enum={v: k for k, v in _fan_modes.items()},
+            ),
+        ),
+    )
 
     @classmethod
     def set(cls, src_id: RamsesID, dst_id: RamsesID, value: str) -> RamsesPacket:
+        assert cls._encode is not None
+        data = cls._encode(fan_mode=value)
         p = RamsesPacket(
             src_id=src_id,
             dst_id=dst_id,
             type="I",
-            data=cls._fan_modes[value],
+            data=data,
         )
         p.expected_response = RamsesPacketResponse(
             src_id=dst_id,
@@ -174,7 +281,8 @@ class Code22f1(Code):
             code="31D9",
         )
         p.code = "22F1" if p.length == 3 else "22F3"
-        _LOGGER.debug(f"Code22f1.set({value}) == {cls._fan_modes[value]} -> {p}")
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug(f"Code22f1.set({value}) == {data} -> {p}")
         return p
 
     @classmethod
@@ -186,19 +294,22 @@ class Code22f3(Code22f1):
     """Fan mode with timer"""
 
     _code = "22F3"
+    _requestable = False
+    _schema = replace(Code22f1._schema, lengths=(7,))
 
-    def _expected_length(self, length: int) -> bool:
-        return length == 7
 
-    @classmethod
-    def get(cls, src_id: RamsesID, dst_id: RamsesID) -> RamsesPacket:
-        raise NotImplementedError
+class FanState(CodeValues):
+    __slots__ = ()
+
+    fan_mode: str | None
+    has_fault: bool | None
 
 
 class Code31d9(Code):
     """Fan state"""
 
     _code = "31D9"
+    values: FanState
 
     _presets = {
         "00": "Away",
@@ -207,135 +318,134 @@ class Code31d9(Code):
         "03": "High",
         "04": "Auto",
     }
-
-    def _expected_length(self, length: int) -> bool:
-        return length in [1, 3]
-
-    def _parse_packet(self) -> None:
-        self.values = {
-            "_label": "Fan state",
-            "signal_strength": -self.packet.signal_strength,
-            "fan_mode": None,
-            "has_fault": None,
-        }
-        assert self.packet.data is not None
-        if self.packet.length == 3:
-            state = self.packet.data[4:6]
-            bitmap = int(self.packet.data[2:4], 16)
-            self.values.update(
-                {
-                    "fan_mode": self._presets.get(state, state),
-                    "has_fault": bool(bitmap & 0x80),
-                }
-            )
+    _schema = Schema(
+        label="Fan state",
+        values=FanState,
+        lengths=(1, 3),
+        fields=(
+            Field("fan_mode", 2, type="enum", enum=_presets, fallback="raw"),
+            Field("has_fault", 1, type="flag", mask=0x80),
+        ),
+    )
 
     @classmethod
     def presets(cls) -> list:
         return list(cls._presets.values())
 
 
+class VentDemand(CodeValues):
+    __slots__ = ()
+
+    percentage: int | None
+    unknown: str | None
+
+
 class Code31e0(Code):
     """Vent demand"""
 
     _code = "31E0"
-
-    def _expected_length(self, length: int) -> bool:
-        return length in [1, 8]
-
-    def _parse_packet(self) -> None:
-        self.values = {
-            "_label": "Vent demand",
-            "signal_strength": -self.packet.signal_strength,
-            "percentage": None,
-            "unknown": None,
-        }
-        assert self.packet.data is not None
-        if self.packet.length == 8:
-            self.values.update(
-                {
-                    "percentage": self._percent(self.packet.data[4:6]),
-                    "unknown": self.packet.data[12:14],  # 64, 1E or AA
-                }
-            )
+    values: VentDemand
+    _schema = Schema(
+        label="Vent demand",
+        values=VentDemand,
+        lengths=(1, 8),
+        fields=(
+            Field("percentage", 2, type="percent"),
+            Field("unknown", 6, type="hex"),  # 64, 1E or AA
+        ),
+    )
+
+
+class DeviceInfo(CodeValues):
+    __slots__ = ()
+
+    sz_oem_code: str | None
+    manufacturer_group: str | None
+    manufacturer_sub_id: str | None
+    product_id: str | None
+    software_ver_id: str | None
+    list_ver_id: str | None
+    unknown: str | None
+    additional_ver_a: str | None
+    additional_ver_b: str | None
+    date_2: RamsesPacketDatetime | None
+    date_1: RamsesPacketDatetime | None
+    description: str | None
 
 
 class Code10e0(Code):
     """Device info"""
 
     _code = "10E0"
-
-    def _expected_length(self, length: int) -> bool:
-        return length == 1 or length >= 29
-
-    def _parse_packet(self) -> None:
-        self.values = {
-            "_label": "Device info",
-            "signal_strength": -self.packet.signal_strength,
-        }
-        if self.packet.length == 1:
-            return
-        assert self.packet.data is not None
-        description, _, _ = self.packet.data[36:].partition("00")
-        self.values.update(
-            {
-                "sz_oem_code": self.packet.data[
-                    14:16
-                ],  # 00/FF is CH/DHW, 01/6x is HVAC
-                "manufacturer_group": self.packet.data[2:6],  # 0001-HVAC, 0002-CH/DHW
-                "manufacturer_sub_id": self.packet.data[6:8],
-                "product_id": self.packet.data[
-                    8:10
-                ],  # if CH/DHW: matches device_type (sometimes)
-                "software_ver_id": self.packet.data[10:12],
-                "list_ver_id": self.packet.data[
-                    12:14
-                ],  # if FF/01 is CH/DHW, then 01/FF
-                "unknown": self.packet.data[14:16],
-                "additional_ver_a": self.packet.data[16:18],
-                "additional_ver_b": self.packet.data[18:20],
-                "date_2": RamsesPacketDatetime(self.packet.data[20:28]),
-                "date_1": RamsesPacketDatetime(self.packet.data[28:36]),
-                "description": bytearray.fromhex(description).decode(),
-            }
-        )
+    values: DeviceInfo
+    _schema = Schema(
+        label="Device info",
+        values=DeviceInfo,
+        lengths=(1, range(29, MAX_LENGTH + 1)),
+        fields=(
+            Field("sz_oem_code", 7, type="hex"),  # 00/FF is CH/DHW, 01/6x is HVAC
+            Field(
+                "manufacturer_group", 1, width=2, type="hex"
+            ),  # 0001-HVAC, 0002-CH/DHW
+            Field("manufacturer_sub_id", 3, type="hex"),
+            Field(
+                "product_id", 4, type="hex"
+            ),  # if CH/DHW: matches device_type (sometimes)
+            Field("software_ver_id", 5, type="hex"),
+            Field("list_ver_id", 6, type="hex"),  # if FF/01 is CH/DHW, then 01/FF
+            Field("unknown", 7, type="hex"),
+            Field("additional_ver_a", 8, type="hex"),
+            Field("additional_ver_b", 9, type="hex"),
+            Field("date_2", 10, width=4, type="date"),
+            Field("date_1", 14, width=4, type="date"),
+            Field("description", 18, width=None, type="ascii"),
+        ),
+    )
+
+
+class DeviceID(CodeValues):
+    __slots__ = ()
+
+    device_id: str | None
 
 
 class Code10e1(Code):
     """Device ID"""
 
     _code = "10E1"
+    values: DeviceID
+    _schema = Schema(
+        label="Device ID",
+        values=DeviceID,
+        lengths=(1, 4),
+        fields=(Field("device_id", 1, width=3, type="device"),),
+    )
 
-    def _expected_length(self, length: int) -> bool:
-        return length in [1, 4]
 
-    def _parse_packet(self) -> None:
-        self.values = {
-            "_label": "Device ID",
-            "signal_strength": -self.packet.signal_strength,
-            "device_id": None,
-        }
-        assert self.packet.data is not None
-        if self.packet.length == 4:
-            self.values.update({"device_id": self._dev_hex_to_id(self.packet.data)})
+class IndoorHumidity(CodeValues):
+    __slots__ = ()
+
+    level: int | None
 
 
 class Code12a0(Code):
     """Indoor humidity"""
 
     _code = "12A0"
+    values: IndoorHumidity
+    _schema = Schema(
+        label="Indoor humidity",
+        values=IndoorHumidity,
+        lengths=(1, 2),
+        fields=(Field("level", 0, width=2),),
+    )
 
-    def _expected_length(self, length: int) -> bool:
-        return length in [1, 2]
 
-    def _parse_packet(self) -> None:
-        self.values = {
-            "_label": "Indoor humidity",
-            "signal_strength": -self.packet.signal_strength,
-            "level": None,
-        }
-        assert self.packet.data is not None
-        if self.packet.length == 2:
-            self.values.update({"level": int(self.packet.data, 16)})
+class BatteryState(CodeValues):
+    __slots__ = ()
+
+    level: int | None
+    low: bool | None
 
 
 class Code1060(Code):
@@ -344,22 +454,25 @@ class Code1060(Code):
     from one of my neighbours with another Orcon system"""
 
     _code = "1060"
+    values: BatteryState
+    _requestable = False
+    _schema = Schema(
+        label="Battery status",
+        values=BatteryState,
+        lengths=(1, 6),
+        fields=(
+            Field("level", 1, type="percent"),
+            Field("low", 2, type="flag", invert=True),
+        ),
+    )
 
-    def _expected_length(self, length: int) -> bool:
-        return length in [1, 6]
 
-    def _parse_packet(self) -> None:
-        assert self.packet.data is not None
-        self.values = {
-            "_label": "Battery status",
-            "signal_strength": -self.packet.signal_strength,
-            "level": self._percent(self.packet.data[2:4]),
-            "low": self.packet.data[4:6] == "00",
-        }
+class RFBind(CodeValues):
+    __slots__ = ()
 
-    @classmethod
-    def get(cls, src_id: RamsesID, dst_id: RamsesID) -> RamsesPacket:
-        raise NotImplementedError
+    zone_idx: int | None
+    command: str | None
+    device_id: str | None
 
 
 class Code1fc9(Code):
@@ -367,93 +480,43 @@ class Code1fc9(Code):
 
     """
        Work in progress
-       FIXME: Length could be a multiple of 6, not sure if that's ever the case with Orcon
+       FIXME: Length could be a multiple of 6, not sure if that's ever the case with Orcon,
+              only the device of the first 6 bytes is decoded
     """
     _code = "1FC9"
+    values: RFBind
+    _requestable = False
+    _schema = Schema(
+        label="RF Bind",
+        values=RFBind,
+        lengths=(range(6, MAX_LENGTH + 1, 6),),
+        fields=(
+            Field("zone_idx", 0),
+            Field("command", 1, width=2, type="hex"),
+            Field("device_id", 3, width=3, type="device"),
+        ),
+    )
 
-    def _expected_length(self, length: int) -> bool:
-        return length % 6 == 0
-
-    def _parse_packet(self) -> None:
-        assert self.packet.data is not None
-        self.values = {
-            "_label": "RF Bind",
-            "signal_strength": -self.packet.signal_strength,
-            "zone_idx": int(self.packet.data[:2], 16),
-            "command": self.packet.data[2:6],
-            "device_id": self._dev_hex_to_id(self.packet.data[6:]),
-        }
 
-    @classmethod
-    def get(cls, src_id: RamsesID, dst_id: RamsesID) -> RamsesPacket:
-        raise NotImplementedError
+class PowerCycles(CodeValues):
+    __slots__ = ()
+
+    power_cycles: str | None
+    power_cycles_2: str | None
 
 
 class Code042f(Code):
     """Counter that seem to increase on every power cycle. Broadcasted on startup"""
 
     _code = "042F"
-
-    def _expected_length(self, length: int) -> bool:
-        return length == 6
-
-    def _parse_packet(self) -> None:
-        assert self.packet.data is not None
-        self.values = {
-            "_label": "Unknown (042F)",
-            "signal_strength": -self.packet.signal_strength,
-            "power_cycles": f"0x{self.packet.data[2:6]}",
-            "power_cycles_2": f"0x{self.packet.data[6:10]}",
-        }
-
-    @classmethod
-    def get(cls, src_id: RamsesID, dst_id: RamsesID) -> RamsesPacket:
-        raise NotImplementedError
-
-
-if __name__ == "__main__":
-    import sys
-
-    """Parse Ramses logfile, from stdin or 1st cli arg"""
-
-    path = sys.argv[1] if len(sys.argv) == 2 else "/dev/stdin"
-    last_msg = ""
-
-    with open(path) as f:
-        while True:
-            if (line := f.readline()) == "":
-                break
-
-            try:
-                if line[26] == " ":  # ramses_rf packet.log
-                    ts = line[:26]
-                    msg = line[27:].strip()
-                else:
-                    ts = line[:32]
-                    msg = line[33:].strip()
-            except IndexError:
-                print(line, end="")
-                continue
-
-            if msg[4:] == last_msg:
-                continue
-            last_msg = msg[4:]
-
-            try:
-                packet = RamsesPacket(envelope={"ts": ts, "msg": msg})
-            except Exception as e:
-                print(f"!!! {e}: {ts} {msg}")
-                continue
-
-            try:
-                if (code_class := globals().get(f"Code{packet.code.lower()}")) is None:
-                    print(
-                        f"WARNING: Class Code{packet.code.lower()} not imported, or does not exist"
-                    )
-                    code_class = Code
-                print(
-                    f"{ts} {packet.signal_strength:03d} {packet.type:>2} {packet.src_id} {packet.dst_id} "
-                    f"{packet.ann_id} {packet.code} {packet.length:03d} {code_class(packet=packet)}"
-                )
-            except Exception as e:
-                print(f"!!! {e}: {line}")
+    values: PowerCycles
+    _requestable = False
+    _schema = Schema(
+        label="Unknown (042F)",
+        values=PowerCycles,
+        lengths=(6,),
+        fields=(
+            Field("power_cycles", 1, width=2, type="hex", prefix="0x"),
+            Field("power_cycles_2", 3, width=2, type="hex", prefix="0x"),
+        ),
+    )
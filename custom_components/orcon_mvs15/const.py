@@ -6,3 +6,12 @@ CONF_REMOTE_ID: str = "remote_id"
 CONF_FAN_ID: str = "fan_id"
 CONF_CO2_ID: str = "co2_id"
 CONF_MQTT_TOPIC: str = "mqtt_topic"
+DEDUP_WINDOW: float = 2.0  # seconds, suppress repeated frames within this window
+PACKET_LOG_FILE: str = "packet.log"  # in the config dir
+PACKET_LOG_MAX_SIZE: int = 10_000_000  # bytes, rotate when packet.log gets bigger
+PACKET_LOG_BACKUPS: int = 50  # rotated generations to keep, ~1.5 MB each gzipped
+PACKET_LOG_COMPRESSION: str | None = "gzip"  # of rotated generations: gzip, xz or None
+PACKET_LOG_TEXT: bool = True  # write packet.log
+PACKET_LOG_ARCHIVE: bool = (
+    False  # write packet.rpa, a binary archive (see packet_archive.py)
+)
@@ -1,26 +1,116 @@
 from __future__ import annotations
 
 import logging
+from collections import Counter, defaultdict
+from collections.abc import Iterable, Mapping
+from typing import Any
 
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
-from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.update_coordinator import (
+    CoordinatorEntity,
+    TimestampDataUpdateCoordinator,
+)
+from homeassistant.util import dt as dt_util
 
 from .const import DOMAIN
 
 _LOGGER = logging.getLogger(__name__)
 
+_MISSING = object()
+
+
+class OrconMVS15DataUpdateCoordinator(
+    TimestampDataUpdateCoordinator[dict[str, str | int]]
+):
+    """Push only, handlers apply what a packet changed with async_apply_delta
+
+    Listeners can be added with a frozenset of keys as context, those are
+    only called when one of the keys changed. Listeners without context are
+    called on every change."""
 
-class OrconMVS15DataUpdateCoordinator(DataUpdateCoordinator[dict[str, str | int]]):
     config_entry: ConfigEntry
 
-    def __init__(self, hass: HomeAssistant, config_entry: ConfigEntry) -> None:
+    def __init__(self, hass: HomeAssistant, config_entry: ConfigEntry | None) -> None:
+        """config_entry is None when replaying logs (see replay)"""
         super().__init__(
             hass, _LOGGER, name=DOMAIN, config_entry=config_entry, always_update=False
         )
+        self.changes: Counter[str] = Counter()
+        self.unchanged = 0
+        # key -> the listeners of that key by their remove callback, None for all keys
+        self._key_listeners: defaultdict[
+            str | None, dict[CALLBACK_TYPE, CALLBACK_TYPE]
+        ] = defaultdict(dict)
 
     async def _async_update_data(self) -> dict:
         """We use it for push only"""
-        if not self.data:
-            return {}
-        return {**self.data}
+        return self.data or {}
+
+    @callback
+    def async_add_listener(
+        self,
+        update_callback: CALLBACK_TYPE,
+        context: Any = None,  # noqa: ANN401  # as in DataUpdateCoordinator
+    ) -> CALLBACK_TYPE:
+        """Also index the listener by the keys in context, for async_apply_delta"""
+        remove_listener = super().async_add_listener(update_callback, context)
+        keys: Iterable[str | None] = (None,) if context is None else context
+
+        @callback
+        def remove_key_listener() -> None:
+            remove_listener()
+            for key in keys:
+                listeners = self._key_listeners[key]
+                listeners.pop(remove_key_listener, None)
+                if not listeners:
+                    del self._key_listeners[key]
+
+        for key in keys:
+            self._key_listeners[key][remove_key_listener] = update_callback
+        return remove_key_listener
+
+    def async_apply_delta(self, delta: Mapping[str, str | int]) -> set[str]:
+        """Update data in place, call the listeners of the keys that changed
+
+        Returns the changed keys, nobody is called if there are none."""
+        data = self.data
+        changed = {
+            key for key, value in delta.items() if data.get(key, _MISSING) != value
+        }
+        if not changed:
+            self.unchanged += 1
+            return changed
+        for key in changed:
+            data[key] = delta[key]
+        self.changes.update(changed)
+        self.last_exception = None
+        self.last_update_success = True
+        self.last_update_success_time = dt_util.utcnow()
+        listeners = {  # once for listeners of several keys
+            remove: update_callback
+            for key in (None, *changed)
+            if key in self._key_listeners
+            for remove, update_callback in self._key_listeners[key].items()
+        }
+        for update_callback in listeners.values():
+            update_callback()
+        return changed
+
+    def stats(self) -> dict[str, object]:
+        return {"unchanged": self.unchanged, "changes": dict(self.changes)}
+
+
+class OrconMVS15CoordinatorEntity(CoordinatorEntity):
+    """Entity that's only updated when one of its keys in the coordinator data changed"""
+
+    def __init__(
+        self, coordinator: OrconMVS15DataUpdateCoordinator, keys: Iterable[str]
+    ) -> None:
+        self.keys = frozenset(keys)
+        super().__init__(coordinator, context=self.keys)
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        if not self.keys.isdisjoint(self.coordinator.data):
+            self._handle_coordinator_update()  # changed before it was added
@@ -0,0 +1,320 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+import logging
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+
+from .codes import CODES
+from .packet_log import CHUNK_SIZE, LogChunk, envelope, read_lines, split_log
+from .ramses_packet import RamsesPacket, RamsesPacketException
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class DecodeLogException(Exception):
+    pass
+
+
+_COLUMNS = ("ts", "signal_strength", "verb", "src", "dst", "ann", "code", "length")
+FORMATS = ("text", "jsonl", "csv")
+
+
+@dataclass(frozen=True)
+class PacketFilter:
+    """Which packets to decode, checked on the frame text before it's parsed
+
+    Frames that aren't in that layout are checked after parsing, the ones
+    that don't parse are reported. Empty sets let everything through,
+    min_rssi is in dBm (like -70)."""
+
+    codes: frozenset[str] = frozenset()
+    src: frozenset[str] = frozenset()
+    dst: frozenset[str] = frozenset()
+    verbs: frozenset[str] = frozenset()
+    min_rssi: int | None = None
+
+    def __bool__(self) -> bool:
+        return bool(self.codes or self.src or self.dst or self.verbs) or (
+            self.min_rssi is not None
+        )
+
+    def match(self, msg: str) -> bool | None:
+        """msg: 064  I --- 29:224547 --:------ 29:224547 31D9 003 000004
+
+        None when msg isn't in that fixed layout, use match_packet then."""
+        if not (
+            len(msg) >= 49
+            and msg[3] == msg[6] == msg[10] == msg[20] == msg[30] == " "
+            and msg[40] == msg[45] == " "
+            and msg[7:10] == "---"
+        ):
+            return None
+        if self.codes and msg[41:45] not in self.codes:
+            return False
+        if self.src and msg[11:20] not in self.src:
+            return False
+        if self.dst and msg[21:30] not in self.dst:
+            return False
+        if self.verbs and msg[4:6].lstrip() not in self.verbs:
+            return False
+        if self.min_rssi is not None:
+            rssi = msg[:3]
+            if not rssi.isdigit() or -int(rssi) < self.min_rssi:
+                return False
+        return True
+
+    def match_packet(self, packet: RamsesPacket) -> bool:
+        """Same as match, on a parsed packet"""
+        if self.codes and packet.code not in self.codes:
+            return False
+        if self.src and packet.src_id not in self.src:
+            return False
+        if self.dst and packet.dst_id not in self.dst:
+            return False
+        if self.verbs and packet.type not in self.verbs:
+            return False
+        if self.min_rssi is not None:
+            rssi = packet.signal_strength  # -1 when there's none
+            if rssi < 0 or -rssi < self.min_rssi:
+                return False
+        return True
+
+    def columns(self) -> list[str]:
+        """CSV columns: the packet's, then the fields of the codes that pass"""
+        fields = dict.fromkeys(
+            name
+            for info in CODES
+            if not self.codes or info.code in self.codes
+            for name in info.decoder._values._fields
+        )
+        return [*_COLUMNS, *fields, "error"]
+
+
+class LogDecoder:
+    """Turns packet log lines into the lines the decode_log CLI prints
+
+    Packets with the same frame as the packet before (RF repeats) are
+    skipped unless repeats is set, last_msg None skips nothing. Repeats are
+    judged on all packets, before packet_filter. first_msg is the frame of
+    the first packet seen, to skip across chunks of a log decoded separately.
+    output is one of FORMATS, lines that aren't packets only show in text."""
+
+    def __init__(
+        self,
+        last_msg: str | None = "",
+        packet_filter: PacketFilter | None = None,
+        output: str = "text",
+        repeats: bool = False,
+    ) -> None:
+        if output not in FORMATS:
+            raise DecodeLogException(f"Unknown output format {output}")
+        self.last_msg = last_msg
+        self.first_msg: str | None = None
+        self.packets = 0
+        self.packet_filter = packet_filter or None
+        self.output = output
+        self.repeats = repeats
+        if output == "csv":
+            self._columns = (packet_filter or PacketFilter()).columns()
+            self._csv = io.StringIO()
+            self._writer = csv.DictWriter(
+                self._csv, self._columns, extrasaction="ignore", lineterminator=""
+            )
+
+    def header(self) -> str | None:
+        """The first line to print, if the format has one"""
+        if self.output != "csv":
+            return None
+        return self._row(dict(zip(self._columns, self._columns)))
+
+    def decode(self, line: str) -> str | None:
+        if (env := envelope(line)) is None:
+            return line if self.output == "text" and not self.packet_filter else None
+        ts, msg = env["ts"], env["msg"]
+
+        self.packets += 1
+        if self.first_msg is None:
+            self.first_msg = msg[4:]
+        if msg[4:] == self.last_msg and not self.repeats:
+            return None
+        self.last_msg = msg[4:]
+        packet_filter = self.packet_filter
+        matched = packet_filter.match(msg) if packet_filter else True
+        if matched is False:
+            return None
+
+        try:
+            packet = RamsesPacket(envelope=env)
+            packet.parse()
+        except RamsesPacketException as e:
+            return self._error(ts, f"{e}: {ts} {msg}")
+        if packet_filter and matched is None and not packet_filter.match_packet(packet):
+            return None
+
+        try:
+            code = CODES.decoder(packet.code)(packet=packet)
+        except Exception as e:  # noqa: BLE001  # reported, the rest of the log is decoded
+            return self._error(ts, f"{e}: {line}")
+        if self.output == "text":
+            return (
+                f"{ts} {packet.signal_strength:03d} {packet.type:>2} {packet.src_id} {packet.dst_id} "
+                f"{packet.ann_id} {packet.code} {packet.length:03d} {code}"
+            )
+        record: dict[str, object] = {
+            "ts": ts,
+            "signal_strength": code.signal_strength,
+            "verb": packet.type,
+            "src": packet.src_id,
+            "dst": packet.dst_id,
+            "ann": packet.ann_id,
+            "code": packet.code,
+            "length": packet.length,
+        }
+        if self.output == "jsonl":
+            record["label"] = code._label
+            record["values"] = code.values.as_dict()
+            return json.dumps(record, default=str)
+        record.update(code.values.items())
+        return self._row(record)
+
+    def _error(self, ts: str, error: str) -> str:
+        if self.output == "jsonl":
+            return json.dumps({"ts": ts, "error": error})
+        if self.output == "csv":
+            return self._row({"ts": ts, "error": error})
+        return f"!!! {error}"
+
+    def _row(self, record: dict[str, object]) -> str:
+        self._csv.seek(0)
+        self._csv.truncate()
+        self._writer.writerow(record)
+        return self._csv.getvalue()
+
+
+def _decode_chunk(
+    chunk: LogChunk, **kwargs: object
+) -> tuple[list[str], str | None, int, str | None]:
+    """Output of a chunk, the frame and output index of its first packet, and its last frame
+
+    kwargs go to LogDecoder. The index is -1 if the first packet didn't show."""
+    decoder = LogDecoder(last_msg=None, **kwargs)  # type: ignore[arg-type]
+    output: list[str] = []
+    first_at = -1
+    for line in chunk.read():
+        packets = decoder.packets
+        if (text := decoder.decode(line)) is None:
+            continue
+        if packets == 0 and decoder.packets == 1:
+            first_at = len(output)
+        output.append(text)
+    return output, decoder.first_msg, first_at, decoder.last_msg
+
+
+def decode_log(
+    paths: Iterable[str],
+    since: datetime | None = None,
+    until: datetime | None = None,
+    jobs: int = 1,
+    chunk_size: int = CHUNK_SIZE,
+    packet_filter: PacketFilter | None = None,
+    output: str = "text",
+    repeats: bool = False,
+) -> Iterator[str]:
+    """The CLI output for log files, decoded in jobs processes
+
+    With more than one job the logs are split into chunks (see split_log)
+    that are decoded in a process pool. The output of the chunks is put
+    back in order, and RF repeats are skipped across chunk boundaries, so
+    it's the same as decoding the lines one after the other. See LogDecoder
+    for the other arguments."""
+    options = {"packet_filter": packet_filter, "output": output, "repeats": repeats}
+    decoder = LogDecoder(**options)  # type: ignore[arg-type]
+    if (header := decoder.header()) is not None:
+        yield header
+    if jobs <= 1:
+        for line in read_lines(paths, since, until):
+            if (text := decoder.decode(line)) is not None:
+                yield text
+        return
+    last_msg: str | None = ""
+    with ProcessPoolExecutor(jobs) as pool:
+        pending: deque[Future] = deque()
+        chunks = split_log(paths, since, until, chunk_size)
+        while True:
+            while len(pending) < 2 * jobs:  # bounded, pipes are read as we go
+                if (chunk := next(chunks, None)) is None:
+                    break
+                pending.append(pool.submit(_decode_chunk, chunk, **options))
+            if not pending:
+                return
+            text_lines, first_msg, first_at, chunk_last_msg = pending.popleft().result()
+            if first_at >= 0 and first_msg == last_msg and not repeats:
+                del text_lines[first_at]  # repeat of the previous chunk's last packet
+            if chunk_last_msg is not None:
+                last_msg = chunk_last_msg
+            yield from text_lines
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import sys
+
+    """Decode packet logs: python -m custom_components.orcon_mvs15.decode_log -j 4 packet.log"""
+
+    parser = argparse.ArgumentParser(description="Decode RAMSES II packet logs")
+    parser.add_argument(
+        "paths", nargs="*", default=["/dev/stdin"], help="packet.log[.N[.gz|.xz]]"
+    )
+    parser.add_argument(
+        "--since", type=datetime.fromisoformat, help="ISO timestamp, inclusive"
+    )
+    parser.add_argument(
+        "--until", type=datetime.fromisoformat, help="ISO timestamp, exclusive"
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="decoding processes, 0 is one per CPU (default: 1)",
+    )
+    parser.add_argument(
+        "--code", action="append", type=str.upper, default=[], help="like 31D9"
+    )
+    parser.add_argument(
+        "--src", action="append", default=[], help="device id, like 29:224547"
+    )
+    parser.add_argument("--dst", action="append", default=[], help="device id")
+    parser.add_argument(
+        "--verb", action="append", choices=["I", "RQ", "RP", "W"], default=[]
+    )
+    parser.add_argument("--min-rssi", type=int, help="dBm, like -70")
+    parser.add_argument("--format", choices=FORMATS, default="text")
+    parser.add_argument("--repeats", action="store_true", help="don't skip RF repeats")
+    args = parser.parse_args()
+
+    sys.stdout.writelines(
+        f"{text}\n"
+        for text in decode_log(
+            args.paths,
+            args.since,
+            args.until,
+            args.jobs or os.cpu_count() or 1,
+            packet_filter=PacketFilter(
+                codes=frozenset(args.code),
+                src=frozenset(args.src),
+                dst=frozenset(args.dst),
+                verbs=frozenset(args.verb),
+                min_rssi=args.min_rssi,
+            ),
+            output=args.format,
+            repeats=args.repeats,
+        )
+    )
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, object]:
+    """RamsesESP counters, transmit airtime and round trip time estimates,
+    and what the packets changed in the coordinators"""
+    runtime = entry.runtime_data
+    return {
+        "config": dict(entry.data),
+        "ramses_esp": runtime.ramses_esp.diagnostics(),
+        "coordinators": {
+            name: coordinator.stats()
+            for name, coordinator in (
+                ("fan", runtime.fan_coordinator),
+                ("co2", runtime.co2_coordinator),
+                ("rem", runtime.rem_coordinator),
+            )
+            if coordinator is not None
+        },
+    }
@@ -48,7 +48,9 @@ class DiscoverEntity:
         _LOGGER.debug(
             f"Setting up '{name}' entity discovery for {self.entity_names_csv} on key '{self.full_discovery_key}'"
         )
-        self._unsub = self.coordinator.async_add_listener(self._add_discovered_entities)
+        self._unsub = self.coordinator.async_add_listener(
+            self._add_discovered_entities, frozenset({self.full_discovery_key})
+        )
 
     def _add_entities(self) -> None:
         _LOGGER.debug(
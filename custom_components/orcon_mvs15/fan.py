@@ -8,12 +8,14 @@ from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import callback, CoreState, HomeAssistant
 from homeassistant.helpers.entity_platform import AddConfigEntryEntitiesCallback
 from homeassistant.helpers.device_registry import DeviceInfo
-from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
 from .models import OrconMVS15Config
 from .ramses_packet import RamsesPacketDatetime, RamsesID
 from .ramses_esp import RamsesESP
-from .coordinator import OrconMVS15DataUpdateCoordinator
+from .coordinator import (
+    OrconMVS15CoordinatorEntity,
+    OrconMVS15DataUpdateCoordinator,
+)
 from .discover_entity import DiscoverEntity
 from .codes import Code22f1
 from .const import DOMAIN
@@ -42,7 +44,7 @@ async def async_setup_entry(
     return True
 
 
-class OrconFan(CoordinatorEntity, FanEntity):
+class OrconFan(OrconMVS15CoordinatorEntity, FanEntity):
     _attr_preset_modes = Code22f1.presets()
     _attr_supported_features = FanEntityFeature.PRESET_MODE
     _attr_translation_key = "fan_states"  # see icons.json
@@ -58,7 +60,7 @@ class OrconFan(CoordinatorEntity, FanEntity):
         name: str,
         discovery_key: str,
     ) -> None:
-        super().__init__(coordinator)
+        super().__init__(coordinator, keys=("fan_mode", "fan_fault"))
         self.hass = hass
         self.fan_id = ramses_id
         self.ramses_esp = ramses_esp
@@ -85,7 +87,9 @@ class OrconFan(CoordinatorEntity, FanEntity):
     async def async_added_to_hass(self) -> None:
         await super().async_added_to_hass()
         if self.hass.state == CoreState.running:
-            await self.ramses_esp.init_fan(discovered_fan_id=self.fan_id)
+            self.hass.async_create_task(
+                self.ramses_esp.init_fan(discovered_fan_id=self.fan_id)
+            )
 
     @callback
     def _handle_coordinator_update(self) -> None:
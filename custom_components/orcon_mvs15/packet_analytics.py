@@ -0,0 +1,474 @@
+from __future__ import annotations
+
+import gzip
+import logging
+import lzma
+from collections.abc import Iterable
+from datetime import datetime, timedelta
+
+import numpy as np
+
+_LOGGER = logging.getLogger(__name__)
+
+NO_DEVICE = -1  # --:------
+VERBS = ("I", "RQ", "RP", "W")
+BROADCAST_CODES = ("31D9", "1298", "31E0")
+
+PACKET_DTYPE = np.dtype(
+    [
+        ("ts", "i8"),  # ns since epoch
+        ("rssi", "i2"),  # -1 if unknown
+        ("verb", "u1"),  # index in VERBS
+        ("src", "i4"),  # (type << 18) | serial, see device_str
+        ("dst", "i4"),
+        ("ann", "i4"),
+        ("code", "u2"),
+        ("length", "u2"),  # payload length in bytes
+        ("payload", "i8"),  # offset of the hex payload in PacketTable.buf
+    ]
+)
+
+# Offsets in a RAMSES_ESP frame: "045 RQ --- 18:149960 29:224547 --:------ 12A0 001 00"
+_RSSI = 0
+_VERB = 4
+_DASHES = 7
+_SRC = 11
+_DST = 21
+_ANN = 31
+_CODE = 41
+_LEN = 46
+_DATA = 50
+_MIN_FRAME = _DATA - 1
+_SPACES = (3, 6, 10, 20, 30, 40, 45, 49)
+
+_HEX = np.full(256, 255, dtype=np.uint8)
+for _i, _c in enumerate(b"0123456789ABCDEF"):
+    _HEX[_c] = _i
+    _HEX[bytes([_c]).lower()[0]] = _i
+
+_VERB_INDEX = {
+    verb.rjust(2).encode(): i for i, verb in enumerate(VERBS)
+}  # b" I", b"RQ", ...
+
+
+class PacketAnalyticsException(Exception):
+    pass
+
+
+class PacketTable:
+    """Packets as a NumPy structured array (PACKET_DTYPE), plus the raw log buffer"""
+
+    def __init__(self, packets: np.ndarray, buf: bytes, skipped: int = 0) -> None:
+        self.packets = packets
+        self.buf = buf
+        self.skipped = skipped
+
+    def __len__(self) -> int:
+        return len(self.packets)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({len(self)} packets, {self.skipped} skipped)"
+
+    def payload(self, i: int) -> str:
+        """Hex payload of packet i"""
+        offset = int(self.packets["payload"][i])
+        return self.buf[offset : offset + 2 * int(self.packets["length"][i])].decode()
+
+    def select(self, mask: np.ndarray) -> PacketTable:
+        return PacketTable(self.packets[mask], self.buf, self.skipped)
+
+
+def device_int(device_id: str) -> int:
+    """Convert (say) '29:224547' to its 24 bit integer form"""
+    if device_id.startswith("-"):
+        return NO_DEVICE
+    return (int(device_id[:2]) << 18) | int(device_id[3:])
+
+
+def device_str(device: int) -> str:
+    """Convert a 24 bit integer device back to (say) '29:224547'"""
+    if device == NO_DEVICE:
+        return "--:------"
+    return f"{device >> 18:02d}:{device & 0x03FFFF:06d}"
+
+
+def code_int(code: str) -> int:
+    return int(code, 16)
+
+
+def _decimal(block: np.ndarray, col: int, width: int) -> tuple[np.ndarray, np.ndarray]:
+    """ASCII digits in rows [col, col + width) to int64, plus a mask of valid rows"""
+    value = np.zeros(block.shape[1], dtype=np.int64)
+    valid = np.ones(block.shape[1], dtype=bool)
+    for column in range(col, col + width):
+        digit = block[column] - np.uint8(48)  # wraps around for anything below '0'
+        valid &= digit <= 9
+        value *= 10
+        value += digit
+    return value, valid
+
+
+def _match(block: np.ndarray, col: int, chars: bytes) -> np.ndarray:
+    """Mask of the lines that have chars at column col"""
+    valid = np.ones(block.shape[1], dtype=bool)
+    for i, char in enumerate(chars):
+        valid &= block[col + i] == char
+    return valid
+
+
+def _devices(block: np.ndarray, col: int) -> tuple[np.ndarray, np.ndarray]:
+    dev_type, valid_type = _decimal(block, col, 2)
+    serial, valid_serial = _decimal(block, col + 3, 6)
+    empty = _match(block, col, b"--:------")
+    valid = empty | (valid_type & valid_serial & (block[col + 2] == ord(":")))
+    return np.where(empty, NO_DEVICE, (dev_type << 18) | serial), valid
+
+
+def _days_from_civil(y: np.ndarray, m: np.ndarray, d: np.ndarray) -> np.ndarray:
+    """Days since 1970-01-01 of a proleptic Gregorian date"""
+    y = y - (m <= 2)
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * np.where(m > 2, m - 3, m + 9) + 2) // 5 + d - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def _local_shift(hour: int) -> int:
+    """Seconds to add to a local wall clock hour (in hours since 1970-01-01) for its UTC time"""
+    try:
+        return (
+            int((datetime(1970, 1, 1) + timedelta(hours=hour)).timestamp())
+            - hour * 3600
+        )
+    except (OverflowError, ValueError, OSError):
+        return 0  # not a date, the line is rejected anyway
+
+
+def _from_local(seconds: np.ndarray) -> np.ndarray:
+    """Seconds since epoch of local times, given as seconds since a local 1970-01-01
+
+    Local like datetime.timestamp() of a naive datetime (and packet_log's time
+    index), the UTC offset of every hour in use is looked up once."""
+    hours, inverse = np.unique(seconds // 3600, return_inverse=True)
+    shifts = np.array([_local_shift(int(hour)) for hour in hours], dtype=np.int64)
+    return seconds + shifts[inverse.reshape(seconds.shape)]
+
+
+def _timestamps(block: np.ndarray, with_tz: bool) -> tuple[np.ndarray, np.ndarray]:
+    """ISO 8601 timestamps with microseconds, with (32 chars) or without (26 chars, local time) UTC offset"""
+    year, valid = _decimal(block, 0, 4)
+    month, v = _decimal(block, 5, 2)
+    valid &= v
+    day, v = _decimal(block, 8, 2)
+    valid &= v
+    hour, v = _decimal(block, 11, 2)
+    valid &= v
+    minute, v = _decimal(block, 14, 2)
+    valid &= v
+    second, v = _decimal(block, 17, 2)
+    valid &= v
+    usec, v = _decimal(block, 20, 6)
+    valid &= v
+    for col, char in ((4, "-"), (7, "-"), (10, "T"), (13, ":"), (16, ":"), (19, ".")):
+        valid &= block[col] == ord(char)
+    seconds = (
+        _days_from_civil(year, month, day) * 86400 + hour * 3600 + minute * 60 + second
+    )
+    if with_tz:
+        tz_hour, v = _decimal(block, 27, 2)
+        valid &= v
+        tz_min, v = _decimal(block, 30, 2)
+        valid &= v & (block[29] == ord(":"))
+        tz_sign = np.where(block[26] == ord("-"), -1, 1)
+        valid &= (block[26] == ord("+")) | (block[26] == ord("-"))
+        seconds -= tz_sign * (tz_hour * 3600 + tz_min * 60)
+    else:
+        seconds = np.where(valid, _from_local(np.where(valid, seconds, 0)), seconds)
+    return (seconds * 1_000_000 + usec) * 1000, valid
+
+
+def _parse_fixed(
+    arr: np.ndarray, starts: np.ndarray, ends: np.ndarray, ts_width: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Parse lines with the fixed width layout, returns the packets and a mask of the lines that didn't fit"""
+    frame = ts_width + 1
+    # Copy the fixed width part of every line into a 2D array, one row per column
+    block = np.ascontiguousarray(
+        np.lib.stride_tricks.sliding_window_view(arr, frame + _DATA)[starts].T
+    )
+    ts, valid = _timestamps(block, with_tz=ts_width == 32)
+    valid &= block[ts_width] == ord(" ")
+    for col in _SPACES:
+        valid &= block[frame + col] == ord(" ")
+    valid &= _match(block, frame + _DASHES, b"---")
+    rssi, valid_rssi = _decimal(block, frame + _RSSI, 3)
+    verb = np.full(block.shape[1], 255, dtype=np.uint8)
+    for chars, i in _VERB_INDEX.items():
+        verb[_match(block, frame + _VERB, chars)] = i
+    valid &= verb != 255
+    src, v = _devices(block, frame + _SRC)
+    valid &= v
+    dst, v = _devices(block, frame + _DST)
+    valid &= v
+    ann, v = _devices(block, frame + _ANN)
+    valid &= v
+    code = np.zeros(block.shape[1], dtype=np.int64)
+    for col in range(frame + _CODE, frame + _CODE + 4):
+        nibble = _HEX[block[col]]
+        valid &= nibble != 255
+        code = code * 16 + nibble
+    length, v = _decimal(block, frame + _LEN, 3)
+    valid &= v
+    size = ends - starts - frame
+    valid &= np.where(length == 0, size == _MIN_FRAME, size == _DATA + 2 * length)
+
+    packets = np.empty(int(valid.sum()), dtype=PACKET_DTYPE)
+    packets["ts"] = ts[valid]
+    packets["rssi"] = np.where(valid_rssi, rssi, -1)[valid]
+    packets["verb"] = verb[valid]
+    packets["src"] = src[valid]
+    packets["dst"] = dst[valid]
+    packets["ann"] = ann[valid]
+    packets["code"] = code[valid]
+    packets["length"] = length[valid]
+    packets["payload"] = starts[valid] + frame + _DATA
+    return packets, ~valid
+
+
+def _parse_slow(line: bytes, offset: int) -> tuple | None:
+    """Parse a line that doesn't have the usual fixed width layout, None if it isn't a packet"""
+    try:
+        text = line.decode()
+        ts, _, msg = text.partition(" ")
+        fields = msg.split()
+        if len(fields) < 8 or fields[2] != "---":
+            return None
+        ns = int(datetime.fromisoformat(ts).timestamp() * 1e6) * 1000  # naive: local
+        length = int(fields[7])
+        data = fields[8] if length else ""
+        if len(data) != 2 * length:
+            return None
+        return (
+            ns,
+            int(fields[0]) if fields[0].isdigit() else -1,
+            VERBS.index(fields[1]),
+            device_int(fields[3]),
+            device_int(fields[4]),
+            device_int(fields[5]),
+            code_int(fields[6]),
+            length,
+            offset + line.rindex(data.encode()) if length else offset + len(line),
+        )
+    except (ValueError, IndexError):
+        return None
+
+
+def _read(path: str) -> bytes:
+    """Whole file, rotated .gz/.xz generations are decompressed"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.endswith(".gz"):
+        return gzip.decompress(data)
+    if path.endswith(".xz"):
+        return lzma.decompress(data)
+    return data
+
+
+def load(paths: str | Iterable[str]) -> PacketTable:
+    """Load one or more packet.log files into a PacketTable, sorted by timestamp"""
+    if isinstance(paths, str):
+        paths = [paths]
+    chunks = []
+    for path in paths:
+        chunk = _read(path)
+        if chunk and not chunk.endswith(b"\n"):
+            chunk += b"\n"
+        chunks.append(chunk)
+    return parse(b"".join(chunks))
+
+
+def parse(buf: bytes) -> PacketTable:
+    """Parse packet.log lines (newline terminated) into a PacketTable, sorted by timestamp"""
+    if not buf:
+        return PacketTable(np.empty(0, dtype=PACKET_DTYPE), buf)
+    # Padded, so the fixed width part of the last line is always within bounds
+    arr = np.frombuffer(buf + bytes(33 + _DATA), dtype=np.uint8)
+
+    ends = np.flatnonzero(arr[: len(buf)] == ord("\n"))
+    starts = np.concatenate(([0], ends[:-1] + 1)).astype(np.int64)
+    ends = np.where((ends > starts) & (arr[ends - 1] == ord("\r")), ends - 1, ends)
+
+    # RAMSES_ESP logs have a 32 char timestamp, ramses_rf logs 26 chars (no UTC offset)
+    with_tz = arr[starts + 26] != ord(" ")
+    found = []
+    rejected = []
+    for mask, ts_width in ((with_tz, 32), (~with_tz, 26)):
+        packets, failed = _parse_fixed(arr, starts[mask], ends[mask], ts_width)
+        found.append(packets)
+        rejected += list(zip(starts[mask][failed], ends[mask][failed]))
+
+    slow = [
+        parsed
+        for s, e in rejected
+        if (parsed := _parse_slow(buf[s:e], int(s))) is not None
+    ]
+    found.append(np.array(slow, dtype=PACKET_DTYPE))
+    packets = np.concatenate(found)
+    skipped = len(rejected) - len(slow)
+    if skipped:
+        _LOGGER.debug(f"Skipped {skipped} lines that are not packets")
+    packets = packets[np.argsort(packets["ts"], kind="stable")]
+    return PacketTable(packets, buf, skipped)
+
+
+def _span_hours(table: PacketTable) -> float:
+    if len(table) < 2:
+        return 0.0
+    return float(table.packets["ts"][-1] - table.packets["ts"][0]) / 3.6e12
+
+
+def rates(table: PacketTable) -> np.ndarray:
+    """Packet count and rate (per hour) per source device and code, busiest first"""
+    p = table.packets
+    keys, counts = np.unique(
+        (p["src"].astype(np.int64) << 16) | p["code"], return_counts=True
+    )
+    result = np.empty(
+        len(keys),
+        dtype=[("src", "i4"), ("code", "u2"), ("count", "i8"), ("per_hour", "f8")],
+    )
+    result["src"] = keys >> 16
+    result["code"] = keys & 0xFFFF
+    result["count"] = counts
+    hours = _span_hours(table)
+    result["per_hour"] = counts / hours if hours else np.nan
+    return result[np.argsort(-counts, kind="stable")]
+
+
+def rssi_percentiles(
+    table: PacketTable, q: tuple[float, ...] = (5, 50, 95)
+) -> np.ndarray:
+    """RSSI percentiles per source device, echoes of our own packets (RSSI 0) excluded"""
+    p = table.packets[table.packets["rssi"] > 0]
+    order = np.argsort(p["src"], kind="stable")
+    src, rssi = p["src"][order], p["rssi"][order]
+    devices, first, counts = np.unique(src, return_index=True, return_counts=True)
+    result = np.empty(
+        len(devices),
+        dtype=[("src", "i4"), ("count", "i8"), ("percentiles", "f8", (len(q),))],
+    )
+    result["src"] = devices
+    result["count"] = counts
+    for i, (start, count) in enumerate(zip(first, counts)):
+        result["percentiles"][i] = -np.percentile(rssi[start : start + count], q)
+    return result
+
+
+def broadcast_gaps(
+    table: PacketTable, codes: tuple[str, ...] = BROADCAST_CODES
+) -> np.ndarray:
+    """Statistics (seconds) of the gaps between consecutive I broadcasts, per source device and code"""
+    p = table.packets
+    mask = (p["verb"] == VERBS.index("I")) & np.isin(
+        p["code"], [code_int(c) for c in codes]
+    )
+    p = p[mask]
+    order = np.lexsort((p["ts"], p["code"], p["src"]))
+    p = p[order]
+    key = (p["src"].astype(np.int64) << 16) | p["code"]
+    gaps = np.diff(p["ts"]) / 1e9
+    same = key[1:] == key[:-1]
+    gaps, gap_key = gaps[same], key[1:][same]
+    keys, first, counts = np.unique(gap_key, return_index=True, return_counts=True)
+    result = np.empty(
+        len(keys),
+        dtype=[
+            ("src", "i4"),
+            ("code", "u2"),
+            ("count", "i8"),
+            ("median", "f8"),
+            ("p95", "f8"),
+            ("max", "f8"),
+        ],
+    )
+    result["src"] = keys >> 16
+    result["code"] = keys & 0xFFFF
+    result["count"] = counts
+    for i, (start, count) in enumerate(zip(first, counts)):
+        median, p95 = np.percentile(gaps[start : start + count], (50, 95))
+        result["median"][i] = median
+        result["p95"][i] = p95
+        result["max"][i] = gaps[start : start + count].max()
+    return result
+
+
+def unanswered(
+    table: PacketTable, code: str = "12A0", window: float = 2.0
+) -> np.ndarray:
+    """Per polled device, the fraction of RQ packets without an RP from that device within window seconds"""
+    p = table.packets
+    code_mask = p["code"] == code_int(code)
+    rq = p[code_mask & (p["verb"] == VERBS.index("RQ"))]
+    rp = p[code_mask & (p["verb"] == VERBS.index("RP"))]
+    # Retries (and their echoes) within the window count as a single poll
+    rq = rq[np.lexsort((rq["ts"], rq["dst"]))]
+    first = np.ones(len(rq), dtype=bool)
+    first[1:] = (rq["dst"][1:] != rq["dst"][:-1]) | (np.diff(rq["ts"]) > window * 1e9)
+    rq = rq[first]
+    rp = rp[np.lexsort((rp["ts"], rp["src"]))]
+    devices = np.unique(rq["dst"])
+    result = np.empty(
+        len(devices),
+        dtype=[
+            ("dst", "i4"),
+            ("polls", "i8"),
+            ("unanswered", "i8"),
+            ("fraction", "f8"),
+        ],
+    )
+    for i, device in enumerate(devices):
+        polls = rq["ts"][rq["dst"] == device]
+        replies = rp["ts"][rp["src"] == device]
+        nxt = np.searchsorted(replies, polls, side="left")
+        answered = nxt < len(replies)
+        answered[answered] = replies[nxt[answered]] - polls[answered] <= window * 1e9
+        result[i] = (device, len(polls), (~answered).sum(), (~answered).mean())
+    return result
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    """Print the reports for one or more packet.log files (rotated, from several sites, ...)"""
+
+    if len(sys.argv) < 2:
+        raise SystemExit(f"Usage: {sys.argv[0]} packet.log [packet.log.1 ...]")
+
+    started = time.perf_counter()
+    table = load(sys.argv[1:])
+    print(f"Loaded {table} in {time.perf_counter() - started:.2f}s")
+    if not len(table):
+        raise SystemExit(0)
+
+    print("\n=== Packet rates")
+    for row in rates(table):
+        print(
+            f"{device_str(row['src'])} {row['code']:04X} {row['count']:8d} {row['per_hour']:8.1f}/h"
+        )
+    print("\n=== RSSI percentiles (dBm, 5/50/95)")
+    for row in rssi_percentiles(table):
+        pct = "/".join(f"{x:.0f}" for x in row["percentiles"])
+        print(f"{device_str(row['src'])} {row['count']:8d} {pct}")
+    print("\n=== Broadcast gaps (s, median/p95/max)")
+    for row in broadcast_gaps(table):
+        print(
+            f"{device_str(row['src'])} {row['code']:04X} {row['count']:8d} "
+            f"{row['median']:.0f}/{row['p95']:.0f}/{row['max']:.0f}"
+        )
+    print("\n=== Unanswered 12A0 polls")
+    for row in unanswered(table):
+        print(
+            f"{device_str(row['dst'])} {row['polls']:8d} {row['unanswered']:8d} {row['fraction']:6.1%}"
+        )
@@ -0,0 +1,349 @@
+from __future__ import annotations
+
+import logging
+import mmap
+import struct
+from collections.abc import Iterable, Iterator
+from datetime import datetime
+from typing import Self
+
+import numpy as np
+
+try:
+    from .packet_analytics import (
+        _HEX,
+        VERBS,
+        PacketTable,
+        device_str,
+        load,
+    )
+except ImportError:  # for __main__
+    from packet_analytics import (  # type: ignore[no-redef]
+        _HEX,
+        VERBS,
+        PacketTable,
+        device_str,
+        load,
+    )
+
+_LOGGER = logging.getLogger(__name__)
+
+# File layout: header, then blocks of [BLOCK_DTYPE][RECORD_DTYPE * count][payload heap, 8 byte aligned]
+MAGIC = b"RAMSESPA"
+VERSION = 1
+_HEADER = struct.Struct("<8sHHH18x")  # magic, version, record size, block header size
+RECORD_DTYPE = np.dtype(
+    {
+        "names": [
+            "ts",
+            "src",
+            "dst",
+            "ann",
+            "payload",
+            "code",
+            "rssi",
+            "length",
+            "verb",
+        ],
+        "formats": ["<i8", "<i4", "<i4", "<i4", "<u4", "<u2", "<i2", "u1", "u1"],
+        "offsets": [0, 8, 12, 16, 20, 24, 26, 28, 29],
+        "itemsize": 32,
+    }
+)  # ts in ns since epoch (UTC), payload is the offset in the block's heap
+BLOCK_DTYPE = np.dtype(
+    [
+        ("first_ts", "<i8"),
+        ("last_ts", "<i8"),
+        ("count", "<u4"),
+        ("heap", "<u4"),  # bytes, including padding
+        ("codes", "<u8"),  # bit (code % 64) is set for every code in the block
+    ]
+)
+INDEX_DTYPE = np.dtype(
+    [
+        ("offset", "i8"),
+        ("first_ts", "i8"),
+        ("last_ts", "i8"),
+        ("count", "u4"),
+        ("codes", "u8"),
+    ]
+)
+
+
+class PacketArchiveException(Exception):
+    pass
+
+
+def _ns(dt: datetime | int | None) -> int | None:
+    if dt is None or isinstance(dt, int):
+        return dt
+    return int(dt.timestamp() * 1_000_000) * 1000
+
+
+def _code_bit(code: int) -> int:
+    return 1 << (code % 64)
+
+
+class PacketArchiveWriter:
+    """Appends packets to a binary archive, a block at a time
+
+    Packets are collected until there are block_records of them (or flush() is
+    called), then written as one block: records sorted by timestamp, followed
+    by their binary payloads."""
+
+    def __init__(self, path: str, block_records: int = 4096) -> None:
+        self.path = path
+        self.block_records = block_records
+        self._f = open(path, "ab")  # noqa: SIM115  # until close()
+        if self._f.tell() == 0:
+            self._f.write(
+                _HEADER.pack(
+                    MAGIC, VERSION, RECORD_DTYPE.itemsize, BLOCK_DTYPE.itemsize
+                )
+            )
+        else:
+            with open(path, "rb") as f:
+                _check_header(f.read(_HEADER.size), path)
+        self._records: list[np.ndarray] = []
+        self._payloads: list[np.ndarray] = []
+        self._pending = 0
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    @property
+    def size(self) -> int:
+        return self._f.tell()
+
+    def append(self, table: PacketTable) -> None:
+        """Add the packets of a PacketTable (see packet_analytics)"""
+        p = table.packets
+        if not len(p):
+            return
+        records = np.zeros(len(p), dtype=RECORD_DTYPE)
+        for field in ("ts", "src", "dst", "ann", "code", "rssi", "length", "verb"):
+            records[field] = p[field]
+        # Hex payloads in table.buf to bytes, in one go
+        nibbles = 2 * p["length"].astype(np.int64)
+        total = int(nibbles.sum())
+        ends = np.cumsum(nibbles)
+        pos = np.repeat(p["payload"] - (ends - nibbles), nibbles) + np.arange(total)
+        hex_values = _HEX[np.frombuffer(table.buf, dtype=np.uint8)[pos]]
+        payload = (hex_values[0::2] << 4) | hex_values[1::2]
+        records["payload"] = (ends - nibbles) // 2  # relative to this table for now
+        start = 0
+        while start < len(records):
+            take = min(self.block_records - self._pending, len(records) - start)
+            chunk = records[start : start + take]
+            first = int(chunk["payload"][0])
+            last = int(chunk["payload"][-1]) + int(chunk["length"][-1])
+            chunk["payload"] -= first
+            self._records.append(chunk)
+            self._payloads.append(payload[first:last])
+            self._pending += take
+            start += take
+            if self._pending >= self.block_records:
+                self.flush()
+
+    def flush(self) -> None:
+        """Write the pending packets as a block"""
+        if not self._pending:
+            return
+        heap_offset = 0
+        for records, payload in zip(self._records, self._payloads):
+            records["payload"] += heap_offset
+            heap_offset += len(payload)
+        records = np.concatenate(self._records, dtype=RECORD_DTYPE)  # keeps the padding
+        records = records[np.argsort(records["ts"], kind="stable")]
+        heap = np.concatenate(self._payloads).astype(np.uint8)
+        padding = -len(heap) % 8
+        codes = 0
+        for code in np.unique(records["code"]):
+            codes |= _code_bit(int(code))
+        block = np.zeros(1, dtype=BLOCK_DTYPE)
+        block["first_ts"] = records["ts"][0]
+        block["last_ts"] = records["ts"][-1]
+        block["count"] = len(records)
+        block["heap"] = len(heap) + padding
+        block["codes"] = codes
+        self._f.write(
+            block.tobytes() + records.tobytes() + heap.tobytes() + bytes(padding)
+        )
+        self._f.flush()
+        self._records.clear()
+        self._payloads.clear()
+        self._pending = 0
+
+    def close(self) -> None:
+        self.flush()
+        self._f.close()
+
+
+def _check_header(header: bytes, path: str) -> None:
+    if len(header) < _HEADER.size:
+        raise PacketArchiveException(f"{path}: not a packet archive")
+    magic, version, record_size, block_size = _HEADER.unpack(header[: _HEADER.size])
+    if magic != MAGIC:
+        raise PacketArchiveException(f"{path}: not a packet archive")
+    if (version, record_size, block_size) != (
+        VERSION,
+        RECORD_DTYPE.itemsize,
+        BLOCK_DTYPE.itemsize,
+    ):
+        raise PacketArchiveException(f"{path}: unsupported archive version {version}")
+
+
+class PacketArchive:
+    """Read-only, memory mapped packet archive
+
+    The block headers are read on open and form the index, blocks outside the
+    requested time range or without the requested code are never touched.
+    Records are returned as NumPy views on the mapping, no copies."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _check_header(self._mm[: _HEADER.size], path)
+        self.index = self._scan()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return int(self.index["count"].sum())
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.path}, {len(self.index)} blocks, {len(self)} packets)"
+
+    def _scan(self) -> np.ndarray:
+        size = len(self._mm)
+        offset = _HEADER.size
+        entries = []
+        while offset + BLOCK_DTYPE.itemsize <= size:
+            block = np.frombuffer(self._mm, dtype=BLOCK_DTYPE, count=1, offset=offset)[
+                0
+            ]
+            end = (
+                offset
+                + BLOCK_DTYPE.itemsize
+                + int(block["count"]) * RECORD_DTYPE.itemsize
+                + int(block["heap"])
+            )
+            if end > size:  # half written, the writer was interrupted
+                _LOGGER.warning(f"{self.path}: ignoring truncated block at {offset}")
+                break
+            entries.append(
+                (
+                    offset,
+                    block["first_ts"],
+                    block["last_ts"],
+                    block["count"],
+                    block["codes"],
+                )
+            )
+            offset = end
+        return np.array(entries, dtype=INDEX_DTYPE)
+
+    def blocks(
+        self,
+        since: datetime | int | None = None,
+        until: datetime | int | None = None,
+        code: str | None = None,
+    ) -> Iterator[tuple[np.ndarray, memoryview]]:
+        """Records (RECORD_DTYPE views) and payload heap of each block, within [since, until)
+
+        since/until are datetimes or ns since epoch. With code, blocks without it
+        are skipped, records of other codes in the blocks that have it are not."""
+        since_ns, until_ns = _ns(since), _ns(until)
+        mask = np.ones(len(self.index), dtype=bool)
+        if since_ns is not None:
+            mask &= self.index["last_ts"] >= since_ns
+        if until_ns is not None:
+            mask &= self.index["first_ts"] < until_ns
+        if code is not None:
+            mask &= (self.index["codes"] & np.uint64(_code_bit(int(code, 16)))) != 0
+        for entry in self.index[mask]:
+            offset = int(entry["offset"]) + BLOCK_DTYPE.itemsize
+            count = int(entry["count"])
+            records = np.frombuffer(
+                self._mm, dtype=RECORD_DTYPE, count=count, offset=offset
+            )
+            heap_offset = offset + count * RECORD_DTYPE.itemsize
+            start = (
+                0 if since_ns is None else int(np.searchsorted(records["ts"], since_ns))
+            )
+            end = (
+                count
+                if until_ns is None
+                else int(np.searchsorted(records["ts"], until_ns))
+            )
+            if start < end:
+                yield records[start:end], memoryview(self._mm)[heap_offset:]
+
+    def envelopes(
+        self,
+        since: datetime | int | None = None,
+        until: datetime | int | None = None,
+        code: str | None = None,
+    ) -> Iterator[dict[str, str]]:
+        """RAMSES_ESP envelopes ({"ts", "msg"}), as RamsesPacket(envelope=...) takes them"""
+        code_int = None if code is None else int(code, 16)
+        for records, heap in self.blocks(since, until, code):
+            for r in records.tolist():
+                ts, src, dst, ann, payload, c, rssi, length, verb = r
+                if code_int is not None and c != code_int:
+                    continue
+                dt = datetime.fromtimestamp(ts // 1000 / 1e6).astimezone()  # local
+                data = (
+                    f" {heap[payload : payload + length].hex().upper()}"
+                    if length
+                    else ""
+                )
+                yield {
+                    "ts": dt.isoformat(timespec="microseconds"),
+                    "msg": f"{rssi if rssi >= 0 else '---':>03} {VERBS[verb]:>2} --- "
+                    f"{device_str(src)} {device_str(dst)} {device_str(ann)} "
+                    f"{c:04X} {length:03d}{data}",
+                }
+
+    def close(self) -> None:
+        try:
+            self._mm.close()
+        except BufferError:  # views still in use, unmapped once they're gone
+            pass
+
+
+def convert(paths: Iterable[str], archive: str, block_records: int = 4096) -> int:
+    """Append text packet.log files (plain, .gz or .xz) to a packet archive, returns the packet count"""
+    table = load(paths)
+    with PacketArchiveWriter(archive, block_records) as writer:
+        writer.append(table)
+    return len(table)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    """Convert text logs into an archive, or dump an archive in packet.log format"""
+
+    if len(sys.argv) >= 4 and sys.argv[1] == "convert":
+        started = time.perf_counter()
+        count = convert(sys.argv[3:], sys.argv[2])
+        print(f"Archived {count} packets in {time.perf_counter() - started:.2f}s")
+    elif len(sys.argv) == 3 and sys.argv[1] == "dump":
+        with PacketArchive(sys.argv[2]) as archive:
+            for envelope in archive.envelopes():
+                print(f"{envelope['ts']} {envelope['msg']}")
+    else:
+        raise SystemExit(
+            f"Usage: {sys.argv[0]} convert archive.rpa packet.log [packet.log.1.gz ...]\n"
+            f"       {sys.argv[0]} dump archive.rpa"
+        )
@@ -0,0 +1,498 @@
+from __future__ import annotations
+
+import bisect
+import gzip
+import logging
+import lzma
+import os
+import queue
+import shutil
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+from datetime import datetime
+from typing import IO, TYPE_CHECKING, ClassVar, TextIO
+
+if TYPE_CHECKING:
+    from .packet_archive import PacketArchiveWriter
+
+_LOGGER = logging.getLogger(__name__)
+
+_STOP = None  # queue sentinel, ends the writer thread
+
+# compression: (suffix of rotated generations, opener)
+COMPRESSION: dict[str, tuple[str, Callable[..., IO]]] = {
+    "gzip": (".gz", gzip.open),
+    "xz": (".xz", lzma.open),
+}
+_SUFFIXES = ("", ".gz", ".xz", ".idx")  # everything that rotates with a generation
+
+INDEX_EVERY = 64 * 1024  # bytes of log between two time index entries
+CHUNK_SIZE = 4 * 1024 * 1024  # bytes, of the chunks split_log() cuts logs into
+
+
+def open_log(path: str, mode: str = "rt") -> IO:
+    """Open a (rotated) log file, .gz and .xz generations are decompressed on the fly"""
+    for suffix, opener in COMPRESSION.values():
+        if path.endswith(suffix):
+            return opener(path, mode)
+    return open(path, mode)
+
+
+def index_path(path: str) -> str:
+    """Time index of a log generation, packet.log.1.gz has packet.log.1.idx"""
+    for suffix, _ in COMPRESSION.values():
+        if path.endswith(suffix):
+            return f"{path[: -len(suffix)]}.idx"
+    return f"{path}.idx"
+
+
+def _ns(dt: datetime) -> int:
+    return int(dt.timestamp() * 1_000_000) * 1000
+
+
+def _line_ns(line: str | bytes) -> int | None:
+    """Timestamp of a log line in ns since epoch, None if it doesn't start with one
+
+    Both our (with UTC offset) and ramses_rf's (local time) lines are understood."""
+    if isinstance(line, bytes):
+        line = line[:32].decode(errors="replace")
+    try:
+        return _ns(datetime.fromisoformat(line[:32].partition(" ")[0]))
+    except ValueError:
+        return None
+
+
+def envelope(line: str) -> dict[str, str] | None:
+    """RAMSES_ESP envelope of a log line, ours or ramses_rf's, None if it's too short"""
+    try:
+        if line[26] == " ":  # ramses_rf packet.log
+            return {"ts": line[:26], "msg": line[27:].strip()}
+        return {"ts": line[:32], "msg": line[33:].strip()}
+    except IndexError:
+        return None
+
+
+def build_index(path: str, every: int = INDEX_EVERY) -> list[tuple[int, int]]:
+    """(Re)build the time index of a log generation by reading it once
+
+    Entries are (ns, offset) pairs, offset in the uncompressed log, about every
+    bytes apart. The sidecar is written next to the log if the directory allows."""
+    entries = []
+    offset = 0
+    indexed_at = -every
+    with open_log(path, "rb") as f:
+        for line in f:
+            if offset - indexed_at >= every and (ns := _line_ns(line)) is not None:
+                entries.append((ns, offset))
+                indexed_at = offset
+            offset += len(line)
+    try:
+        with open(f"{index_path(path)}.tmp", "w") as f:
+            f.writelines(f"{ns} {offset}\n" for ns, offset in entries)
+        os.replace(f"{index_path(path)}.tmp", index_path(path))
+    except OSError as e:
+        _LOGGER.debug(f"Can't save the time index of {path}: {e}")
+    return entries
+
+
+def read_index(path: str) -> list[tuple[int, int]]:
+    """The time index of a log generation, built first if it's missing or stale"""
+    entries = []
+    try:
+        with open(index_path(path)) as f:
+            for line in f:
+                ns, _, offset = line.partition(" ")
+                try:
+                    entries.append((int(ns), int(offset)))
+                except ValueError:  # torn write, the rest is fine
+                    continue
+    except FileNotFoundError:
+        return build_index(path)
+    compressed = any(path.endswith(suffix) for suffix, _ in COMPRESSION.values())
+    if not compressed and entries and entries[-1][1] > os.path.getsize(path):
+        return build_index(path)  # left behind by a previous file with this name
+    return entries
+
+
+def _byte_range(
+    path: str, since_ns: int | None, until_ns: int | None
+) -> tuple[int, int | None]:
+    """Offsets to start and stop reading path for [since, until), from its time index"""
+    start, end = 0, None
+    if (since_ns is not None or until_ns is not None) and os.path.isfile(path):
+        entries = read_index(path)
+        if since_ns is not None:
+            i = bisect.bisect_right(entries, since_ns, key=lambda e: e[0]) - 1
+            start = entries[i][1] if i >= 0 else 0
+        if until_ns is not None:
+            i = bisect.bisect_left(entries, until_ns, key=lambda e: e[0])
+            end = entries[i][1] if i < len(entries) else None
+    return start, end
+
+
+def _in_range(ns: int, since_ns: int | None, until_ns: int | None) -> bool:
+    return (since_ns is None or ns >= since_ns) and (until_ns is None or ns < until_ns)
+
+
+def read_lines(
+    paths: Iterable[str],
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> Iterator[str]:
+    """Lines (without newline) of log files within [since, until), oldest file first
+
+    Lines are expected in time order. The time index is bisected for the
+    offsets to start and stop reading, so only the range and at most an index
+    step on either side are read. Lines
+    without timestamp are passed on once the range started. Only regular
+    files are indexed, anything else (like /dev/stdin) is read all the way."""
+    since_ns = None if since is None else _ns(since)
+    until_ns = None if until is None else _ns(until)
+    for path in paths:
+        start, end = _byte_range(path, since_ns, until_ns)
+        if end is not None and end <= start:
+            continue
+        with open_log(path, "rb") as f:
+            if start:
+                f.seek(start)
+            offset = start
+            started = since_ns is None
+            for raw in f:
+                if end is not None and offset >= end:
+                    break
+                offset += len(raw)
+                line = raw.decode(errors="replace").rstrip("\r\n")
+                if (ns := _line_ns(line)) is None:
+                    if started:
+                        yield line
+                    continue
+                if not _in_range(ns, since_ns, until_ns):
+                    continue
+                started = True
+                yield line
+
+
+@dataclass(frozen=True)
+class LogChunk:
+    """Whole lines of a log: a byte range of a plain file, or the lines themselves
+
+    Picklable, so chunks can be read in other processes."""
+
+    path: str
+    start: int = 0
+    end: int = 0
+    since_ns: int | None = None
+    until_ns: int | None = None
+    lines: tuple[str, ...] | None = None
+
+    def read(self) -> list[str]:
+        """The lines, as read_lines() gives them"""
+        if self.lines is not None:
+            return list(self.lines)
+        with open(self.path, "rb") as f:
+            f.seek(self.start)
+            text = f.read(self.end - self.start).decode(errors="replace")
+        lines = text.split("\n")
+        if not lines[-1]:  # the chunk ends with a newline
+            lines.pop()
+        lines = [line.rstrip("\r") for line in lines]
+        if self.since_ns is None and self.until_ns is None:
+            return lines
+        return [
+            line
+            for line in lines
+            if (ns := _line_ns(line)) is None
+            or _in_range(ns, self.since_ns, self.until_ns)
+        ]
+
+
+def split_log(
+    paths: Iterable[str],
+    since: datetime | None = None,
+    until: datetime | None = None,
+    size: int = CHUNK_SIZE,
+) -> Iterator[LogChunk]:
+    """Chunks of about size bytes with the lines read_lines() gives, in the same order
+
+    Plain files are cut on line boundaries, a chunk is only an offset range.
+    Compressed files and pipes can't be cut without reading them, their lines
+    are read here and handed out in chunks."""
+    since_ns = None if since is None else _ns(since)
+    until_ns = None if until is None else _ns(until)
+    for path in paths:
+        compressed = any(path.endswith(suffix) for suffix, _ in COMPRESSION.values())
+        if compressed or not os.path.isfile(path):
+            batch: list[str] = []
+            batch_size = 0
+            for line in read_lines([path], since, until):
+                batch.append(line)
+                batch_size += len(line) + 1
+                if batch_size >= size:
+                    yield LogChunk(path, lines=tuple(batch))
+                    batch, batch_size = [], 0
+            if batch:
+                yield LogChunk(path, lines=tuple(batch))
+            continue
+        start, end = _byte_range(path, since_ns, until_ns)
+        with open(path, "rb") as f:
+            if end is None:
+                end = f.seek(0, os.SEEK_END)
+            f.seek(start)
+            if since_ns is not None:
+                """Start at the first line in range, lines without timestamp before it are skipped"""
+                while start < end:
+                    raw = f.readline()
+                    if not raw:
+                        break
+                    if (ns := _line_ns(raw)) is not None and _in_range(
+                        ns, since_ns, until_ns
+                    ):
+                        break
+                    start += len(raw)
+            while start < end:
+                f.seek(min(start + size, end))
+                stop = min(end, f.tell() + len(f.readline()))
+                yield LogChunk(path, start, stop, since_ns, until_ns)
+                start = stop
+
+
+class PacketLog:
+    """Appends lines to a log file from one writer thread
+
+    write() only puts the line in a bounded queue, the thread drains it in
+    batches and flushes once flush_size bytes are buffered or flush_interval
+    seconds have passed. It keeps track of the file size itself and rotates
+    at max_size, keeping backups old generations (path.1 is the newest).
+    Rotated generations are compressed by a separate thread, unless
+    compression is None. Use open()/close() to share one writer between
+    everyone logging to the same path.
+
+    Each generation has a sparse time index next to it (see read_index), an
+    entry every index_every bytes, that rotates along with it.
+
+    With archive, the lines are also parsed into a binary packet archive
+    (see packet_archive) next to the log, path with .rpa instead of .log.
+    Without text, only the archive is written."""
+
+    _writers: ClassVar[dict[str, PacketLog]] = {}
+    _writers_lock = threading.Lock()
+
+    def __init__(
+        self,
+        path: str,
+        max_size: int = 10_000_000,
+        backups: int = 10,
+        flush_size: int = 64 * 1024,
+        flush_interval: float = 1.0,
+        max_queued: int = 10_000,
+        compression: str | None = "gzip",
+        text: bool = True,
+        archive: bool = False,
+        archive_max_size: int = 50_000_000,
+        archive_interval: float = 300.0,
+        index_every: int = INDEX_EVERY,
+    ) -> None:
+        if compression is not None and compression not in COMPRESSION:
+            raise ValueError(f"Unknown compression {compression}")
+        self.path = path
+        self.text = text
+        self.archive_path = f"{os.path.splitext(path)[0]}.rpa" if archive else None
+        self.archive_max_size = archive_max_size
+        self.archive_interval = (
+            archive_interval  # seconds, max age of unwritten archive packets
+        )
+        self.max_size = max_size
+        self.backups = backups
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.index_every = index_every
+        self.dropped = 0  # lines lost because the queue was full
+        self._queue: queue.Queue[str | None] = queue.Queue(maxsize=max_queued)
+        self._stop = threading.Event()  # stop once the queue is empty
+        self.compression = compression
+        self._compressor: threading.Thread | None = None
+        self._f: TextIO | None = None  # the writer thread's
+        self._size = 0
+        self._idx: TextIO | None = None
+        self._indexed_at = 0  # offset of the last index entry
+        self._archive: PacketArchiveWriter | None = None
+        self._archived_at = 0.0
+        self._users = 0
+        self._thread = threading.Thread(
+            target=self._run, name=f"packet_log {path}", daemon=True
+        )
+        self._thread.start()
+
+    @classmethod
+    def open(cls, path: str, **kwargs: float | str | None) -> PacketLog:
+        """The writer for path, created on first use"""
+        with cls._writers_lock:
+            if (writer := cls._writers.get(path)) is None:
+                writer = cls._writers[path] = cls(path, **kwargs)  # type: ignore[arg-type]
+            writer._users += 1
+            return writer
+
+    def close(self) -> None:
+        """Done writing, the last user stops the thread after it wrote what's queued"""
+        with self._writers_lock:
+            self._users -= 1
+            if self._users > 0:
+                return
+            del self._writers[self.path]
+        try:
+            self._queue.put_nowait(_STOP)
+        except queue.Full:  # don't wait for the thread, we may be on the event loop
+            self._stop.set()
+            try:
+                self._queue.put_nowait(_STOP)  # the thread emptied it meanwhile
+            except queue.Full:
+                pass
+
+    def write(self, line: str) -> None:
+        """Queue a line (without newline) to be written, never blocks"""
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    def _open(self) -> tuple[TextIO, int]:
+        f = open(self.path, "a")  # noqa: SIM115  # open until rotated or closed
+        self._idx = open(index_path(self.path), "a")  # noqa: SIM115  # same
+        self._indexed_at = -self.index_every  # index the first batch
+        return f, f.tell()
+
+    def _close(self) -> None:
+        for f in (self._f, self._idx):
+            if f is not None:
+                try:
+                    f.close()
+                except OSError:
+                    pass
+        self._f = self._idx = None
+
+    def _index(self, batch: list[str]) -> None:
+        """Add an index entry for the batch about to be written, if it's time"""
+        if self._idx is None or self._size - self._indexed_at < self.index_every:
+            return
+        for line in batch:
+            if (ns := _line_ns(line)) is not None:
+                self._idx.write(f"{ns} {self._size}\n")
+                self._idx.flush()
+                self._indexed_at = self._size
+                return
+
+    def _rotate(self, path: str, compress: bool = True) -> None:
+        if self._compressor is not None:  # still busy with the previous generation
+            self._compressor.join()
+        for suffix in _SUFFIXES:  # make room, the oldest goes
+            try:
+                os.remove(f"{path}.{self.backups}{suffix}")
+            except FileNotFoundError:
+                pass
+        for i in range(self.backups, 1, -1):
+            for suffix in _SUFFIXES:
+                try:
+                    os.replace(f"{path}.{i - 1}{suffix}", f"{path}.{i}{suffix}")
+                except FileNotFoundError:
+                    continue
+        os.replace(path, f"{path}.1")
+        try:
+            os.replace(index_path(path), index_path(f"{path}.1"))
+        except FileNotFoundError:
+            pass
+        if compress and self.compression is not None:
+            self._compressor = threading.Thread(
+                target=self._compress,
+                args=(f"{path}.1",),
+                name=f"packet_log compress {path}",
+                daemon=True,
+            )
+            self._compressor.start()
+
+    def _compress(self, path: str) -> None:
+        """Replace path by its compressed version"""
+        assert self.compression is not None
+        suffix, opener = COMPRESSION[self.compression]
+        try:
+            with open(path, "rb") as src, opener(f"{path}{suffix}.tmp", "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.replace(f"{path}{suffix}.tmp", f"{path}{suffix}")
+            os.remove(path)
+        except OSError as e:
+            _LOGGER.error(f"Error compressing {path}: {e}")
+
+    def _write_text(self, batch: list[str], size: int) -> None:
+        if self._f is None:
+            self._f, self._size = self._open()
+        self._index(batch)
+        self._f.write("\n".join(batch) + "\n")
+        self._f.flush()
+        self._size += size  # ascii, so characters are bytes
+        if self._size > self.max_size:
+            self._close()
+            self._rotate(self.path)
+
+    def _write_archive(self, batch: list[str], stopping: bool) -> None:
+        from .packet_analytics import parse  # numpy, only when archiving
+        from .packet_archive import PacketArchiveWriter
+
+        assert self.archive_path is not None
+        if self._archive is None:
+            self._archive = PacketArchiveWriter(self.archive_path)
+            self._archived_at = time.monotonic()
+        self._archive.append(parse(("\n".join(batch) + "\n").encode()))
+        if stopping or time.monotonic() - self._archived_at > self.archive_interval:
+            self._archive.flush()
+            self._archived_at = time.monotonic()
+        if stopping or self._archive.size > self.archive_max_size:
+            self._archive.close()
+            self._archive = None
+            if not stopping:  # archives are mmap'ed, so not compressed
+                self._rotate(self.archive_path, compress=False)
+
+    def _run(self) -> None:
+        batch: list[str] = []
+        buffered = 0
+        last_flush = time.monotonic()
+        stopping = False
+        while not stopping:
+            timeout = max(0.0, last_flush + self.flush_interval - time.monotonic())
+            try:
+                if self._stop.is_set():
+                    line = self._queue.get_nowait()
+                else:
+                    line = self._queue.get(timeout=timeout if batch else None)
+                while True:  # take whatever else is queued, up to flush_size
+                    if line is _STOP:
+                        stopping = True
+                        break
+                    batch.append(line)
+                    buffered += len(line) + 1
+                    if buffered >= self.flush_size:
+                        break
+                    line = self._queue.get_nowait()
+            except queue.Empty:
+                stopping = self._stop.is_set()
+            if not batch or (
+                not stopping
+                and buffered < self.flush_size
+                and time.monotonic() - last_flush < self.flush_interval
+            ):
+                continue
+            try:
+                if self.text:
+                    self._write_text(batch, buffered)
+                if self.archive_path is not None:
+                    self._write_archive(batch, stopping)
+            except Exception as e:  # noqa: BLE001  # keep logging, whatever happens
+                _LOGGER.error(f"Error writing {self.path}: {e}")
+                self._close()
+                self._archive = None
+            batch.clear()
+            buffered = 0
+            last_flush = time.monotonic()
+        self._close()
+        if self._archive is not None:
+            self._archive.close()
@@ -1,25 +1,43 @@
 from __future__ import annotations
 
-import os
 import logging
 import asyncio
-import json
+import time
 
+from collections import Counter
 from collections.abc import Callable
-from typing import TextIO
+from functools import partial
 from datetime import datetime
 
 from homeassistant.components import mqtt as mqtt_client
 from homeassistant.components.mqtt import ReceiveMessage
 from homeassistant.core import HomeAssistant, Event
 from homeassistant.exceptions import ConfigEntryNotReady
-from homeassistant.helpers.event import async_call_later
 from homeassistant.helpers.device_registry import async_get as get_dev_reg
 
-from .ramses_packet import RamsesPacket, RamsesID
+from .ramses_packet import (
+    RamsesPacket,
+    RamsesPacketException,
+    RamsesID,
+    DEVICES,
+    NO_DEVICE,
+)
 from .ramses_packet_queue import RamsesPacketQueue
+from .ramses_packet_dedup import RamsesPacketDedup
+from .ramses_retry_scheduler import RamsesRetryScheduler
+from .ramses_tx_scheduler import RamsesTxScheduler, TxPriority
+from .ramses_rtt import RamsesRttEstimator
+from .packet_log import PacketLog
 from .mqtt import MQTT
-from .const import DOMAIN
+from .const import (
+    DOMAIN,
+    DEDUP_WINDOW,
+    PACKET_LOG_MAX_SIZE,
+    PACKET_LOG_BACKUPS,
+    PACKET_LOG_COMPRESSION,
+    PACKET_LOG_TEXT,
+    PACKET_LOG_ARCHIVE,
+)
 from .codes import *  # noqa: F403
 
 # flake8: noqa: F405
@@ -27,6 +45,14 @@ from .codes import *  # noqa: F403
 _LOGGER = logging.getLogger(__name__)
 
 
+class RamsesESPException(Exception):
+    pass
+
+
+class RamsesESPTimeout(RamsesESPException):
+    """No response to a request, after all retries"""
+
+
 class RamsesESP:
     def __init__(
         self,
@@ -36,6 +62,9 @@ class RamsesESP:
         fan_id: RamsesID,
         co2_id: RamsesID,
         gateway_id: RamsesID,
+        packet_log_path: str,
+        dedup_window: float = DEDUP_WINDOW,
+        dedup_clock: Callable[[], float] = time.monotonic,
     ) -> None:
         self.hass = hass
         self.mqtt = mqtt
@@ -43,9 +72,22 @@ class RamsesESP:
         self.fan_id = fan_id
         self.co2_id = co2_id
         self.gateway_id = gateway_id
+        self._update_devices()
         self._handlers: dict = {}
+        self.stats: Counter[str] = Counter()  # admitted and dropped packets, by reason
         self._send_queue = RamsesPacketQueue()
-        self._log_f: TextIO | None = None
+        self._dedup = RamsesPacketDedup(window=dedup_window, clock=dedup_clock)
+        self._retries = RamsesRetryScheduler(self._retry_pending_request)
+        self._tx = RamsesTxScheduler(self._transmit, self._evict)
+        self.rtt = RamsesRttEstimator()
+        self._packet_log = PacketLog.open(
+            packet_log_path,
+            max_size=PACKET_LOG_MAX_SIZE,
+            backups=PACKET_LOG_BACKUPS,
+            compression=PACKET_LOG_COMPRESSION,
+            text=PACKET_LOG_TEXT,
+            archive=PACKET_LOG_ARCHIVE,
+        )
         if self.fan_id:
             _LOGGER.info(f"Using previously discovered fan id ({self.fan_id})")
         else:
@@ -68,54 +110,146 @@ class RamsesESP:
         if event:  # only on Home-Assistant restart
             """sleep for a bit, mqtt (or the stick) is not ready yet for some reason"""
             await asyncio.sleep(2)
-        if self.fan_id:
-            await self.init_fan()
-        if self.co2_id:
-            await self.init_co2()
+        await asyncio.gather(
+            self.init_fan() if self.fan_id else asyncio.sleep(0),
+            self.init_co2() if self.co2_id else asyncio.sleep(0),
+        )
 
     async def init_fan(self, discovered_fan_id: RamsesID | None = None) -> None:
         """Fetch current fan state + device info on startup"""
         if discovered_fan_id:
             self.fan_id = discovered_fan_id
+            self._update_devices()
             _LOGGER.debug(f"Fetching device info for discovered fan ({self.fan_id})")
-        await self.publish(Code10e0.get(src_id=self.gateway_id, dst_id=self.fan_id))
-        await self.publish(Code12a0.get(src_id=self.gateway_id, dst_id=self.fan_id))
-        await self.publish(Code31d9.get(src_id=self.gateway_id, dst_id=self.fan_id))
+        await self._request_all(
+            Code10e0.get(src_id=self.gateway_id, dst_id=self.fan_id),
+            Code12a0.get(src_id=self.gateway_id, dst_id=self.fan_id),
+            Code31d9.get(src_id=self.gateway_id, dst_id=self.fan_id),
+        )
 
     async def init_co2(self, discovered_co2_id: RamsesID | None = None) -> None:
         """Fetch current CO2 sensor state + device info on startup or discovery"""
         if discovered_co2_id:
             self.co2_id = discovered_co2_id
+            self._update_devices()
             _LOGGER.debug(
                 f"Fetching device info for discovered CO2 sensor ({self.co2_id})"
             )
-        await self.publish(Code10e0.get(src_id=self.gateway_id, dst_id=self.co2_id))
-        await self.publish(Code1298.get(src_id=self.gateway_id, dst_id=self.co2_id))
-        await self.publish(Code31e0.get(src_id=self.gateway_id, dst_id=self.co2_id))
+        await self._request_all(
+            Code10e0.get(src_id=self.gateway_id, dst_id=self.co2_id),
+            Code1298.get(src_id=self.gateway_id, dst_id=self.co2_id),
+            Code31e0.get(src_id=self.gateway_id, dst_id=self.co2_id),
+        )
 
     async def req_humidity(self, now: datetime | None = None) -> None:
         """12A0 is not announced so we need to fetch it ourselves
         Will be called by async_track_time_interval, if the 12A0 call from self.setup responds"""
         await self.publish(Code12a0.get(src_id=self.gateway_id, dst_id=self.fan_id))
 
-    async def publish(self, packet: RamsesPacket) -> None:
-        await self.mqtt.publish(packet)
-        if not packet.expected_response:
-            return
-        packet.expected_response.cancel_retry_handler = async_call_later(
-            # Try again if expected_response wasn't received within packet.expected_response.timeout seconds
-            self.hass,
-            packet.expected_response.timeout,
-            lambda now, pkt=packet: self._schedule_retry(pkt),
+    async def _request_all(self, *packets: RamsesPacket) -> None:
+        """Send the requests concurrently, the handlers take care of the responses"""
+        for packet, result in zip(
+            packets,
+            await asyncio.gather(
+                *(self.request(packet) for packet in packets), return_exceptions=True
+            ),
+        ):
+            if isinstance(result, Exception):
+                _LOGGER.warning(
+                    f"No response to {packet.code} from {packet.dst_id}: {result}"
+                )
+
+    async def request(
+        self,
+        packet: RamsesPacket,
+        timeout: float | None = None,
+        priority: TxPriority = TxPriority.POLL,
+    ) -> Code:
+        """Publish packet and return its decoded expected response
+
+        timeout fixes the time to wait for a response on the first try instead
+        of deriving it from measured round trip times, retries back off from there.
+        Raises RamsesESPTimeout when no response came after all retries."""
+        if packet.expected_response is None:
+            raise RamsesESPException(f"No response expected to {packet}")
+        if timeout is not None:
+            packet.expected_response.timeout = timeout
+        waiter: asyncio.Future[Code] = self.hass.loop.create_future()
+        start = self.hass.loop.time()
+        await self.publish(packet, waiter, priority)
+        result = await waiter
+        _LOGGER.debug(
+            f"Response to {packet.code} from {packet.dst_id} "
+            f"after {(self.hass.loop.time() - start) * 1000:.0f} ms"
         )
-        self._send_queue.add(packet)
+        return result
+
+    async def publish(
+        self,
+        packet: RamsesPacket,
+        waiter: asyncio.Future | None = None,
+        priority: TxPriority = TxPriority.POLL,
+    ) -> None:
+        """Queue packet for transmission, waiter (if any) gets the decoded expected response"""
+        if (
+            packet.type == "RQ"  # commands are sent again, A B A must end on A
+            and packet.expected_response
+            and (pending := self._send_queue.pending(packet)) is not None
+            and pending is not packet  # a retry of the pending packet itself
+        ):
+            """An identical request is already waiting for its response, which will do for both"""
+            _LOGGER.debug(
+                f"Coalesced with pending packet {pending.packet_id}: {packet}"
+            )
+            self.stats["coalesced"] += 1
+            if waiter is not None:
+                self._send_queue.add_waiter(pending, waiter)
+            return
+        if packet.expected_response:
+            # pending from now on, so identical requests coalesce while this one waits to be sent
+            self._send_queue.add(packet)
+            packet.expected_response.cancel_retry_handler = partial(
+                self._retries.cancel, packet
+            )
+            if waiter is not None:
+                self._send_queue.add_waiter(packet, waiter)
+        self._tx.submit(packet, priority)
+
+    async def _transmit(self, packet: RamsesPacket) -> bool:
+        """Called by the TX scheduler when it's packet's turn, False if it's no longer needed"""
+        if packet.expected_response is None:
+            await self.mqtt.publish(packet)
+            return True
+        if packet not in self._send_queue:  # answered or given up on while waiting
+            return False
+        await self.mqtt.publish(packet)
+        r = packet.expected_response
+        r.tries += 1
+        r.sent_at = self.hass.loop.time()
+        rto = self.rtt.rto(packet.dst, packet.code) if r.timeout is None else r.timeout
+        # Try again if expected_response wasn't received in time, backing off on every retry
+        self._retries.schedule(packet, self.rtt.backoff(rto, r.tries))
+        return True
+
+    def _evict(self, packet: RamsesPacket) -> None:
+        """TX scheduler dropped a poll that waited too long"""
+        _LOGGER.debug(f"Evicted from transmit queue: {packet}")
+        self.stats["tx_evicted"] += 1
+        if packet in self._send_queue:
+            self._send_queue.fail(
+                packet,
+                RamsesESPException(f"{packet.code} request to {packet.dst_id} evicted"),
+            )
 
     async def handle_ramses_mqtt_message(self, msg: ReceiveMessage) -> None:
-        """Decode JSON, parse the MQTT payload and log it to file"""
+        """Decode the envelope, parse the MQTT payload and log it to file"""
         try:
-            envelope = json.loads(msg.payload)
-            await self._handle_ramses_packet(envelope)
-            await self.packet_log(envelope)
+            packet = RamsesPacket.from_payload(msg.payload)
+            await self._handle_ramses_packet(packet)
+            self.packet_log(packet)
+        except RamsesPacketException as e:
+            _LOGGER.warning(f"Malformed Ramses-ESP MQTT message {msg.payload}: {e}")
+            self.stats["malformed"] += 1
         except Exception:
             _LOGGER.error(
                 f"Failed to process Ramses-ESP MQTT message {msg.payload}",
@@ -142,7 +276,26 @@ class RamsesESP:
             _LOGGER.error(f"Error setting fan preset mode '{mode}': {e}")
             return
         _LOGGER.info(f"Setting fan preset mode to {mode}")
-        await self.publish(packet)
+        await self.publish(packet, priority=TxPriority.COMMAND)
+
+    def cleanup(self) -> None:
+        """Stop transmitting and retrying, pending requests are cancelled"""
+        self._tx.stop()
+        self._retries.stop()
+        self._send_queue.clear()
+        self._packet_log.close()
+
+    def diagnostics(self) -> dict[str, object]:
+        """Counters and estimates, for the config entry diagnostics"""
+        return {
+            "stats": dict(self.stats),
+            "pending": len(self._send_queue),
+            "tx_queued": len(self._tx),
+            "tx_airtime_used": round(self._tx.airtime_used, 3),
+            "packet_log_dropped": self._packet_log.dropped,
+            "rtt": self.rtt.estimates(),
+            "decode_cache": CODES.cache_stats(),
+        }
 
     def add_handler(self, code: str, func: Callable) -> None:
         _LOGGER.debug(f"Adding handler for code {code}")
@@ -152,9 +305,18 @@ class RamsesESP:
         _LOGGER.debug(f"Remove handler for code {code}")
         del self._handlers[code]
 
-    def _schedule_retry(self, packet: RamsesPacket) -> None:
-        self.hass.loop.call_soon_threadsafe(
-            lambda: self.hass.async_create_task(self._retry_pending_request(packet))
+    def _update_devices(self) -> None:
+        """Refresh the device handles, call after changing any of the *_id attributes"""
+        self._fan = DEVICES.handle(self.fan_id)
+        self._co2 = DEVICES.handle(self.co2_id)
+        self._own_devices = frozenset(
+            {
+                self._fan,
+                self._co2,
+                DEVICES.handle(self.gateway_id),
+                DEVICES.handle(self.remote_id),
+            }
+            - {NO_DEVICE}
         )
 
     async def _retry_pending_request(self, packet: RamsesPacket) -> None:
@@ -163,90 +325,81 @@ class RamsesESP:
         packet.expected_response.max_retries -= 1
         if packet.expected_response.max_retries < 0:
             _LOGGER.warning(f"Request timed out: {packet}")
-            self._send_queue.remove(packet)
+            self._send_queue.fail(
+                packet,
+                RamsesESPTimeout(f"{packet.code} request to {packet.dst_id} timed out"),
+            )
             return
         _LOGGER.debug(f"Retry {packet}")
-        await self.publish(packet)
+        await self.publish(packet, priority=TxPriority.RETRY)
 
-    async def _handle_ramses_packet(self, envelope: dict) -> None:
-        try:
-            packet = RamsesPacket(envelope=envelope)
-        except Exception:
-            _LOGGER.error(f"Error parsing MQTT message {envelope}", exc_info=True)
-            return
-        if (code_class := globals().get(f"Code{packet.code.lower()}")) is None:
-            _LOGGER.warning(
-                f"Class Code{packet.code.lower()} not imported, or does not exist"
-            )
-            code_class = Code
-        payload = code_class(packet=packet)
-        if (  # only continue with our own devices or on a startup message
-            packet.src_id
-            not in {
-                self.fan_id,
-                self.co2_id,
-                self.gateway_id,
-                self.remote_id,
-            }
-            and packet.code != "042F"
-        ):
+    def _admit(self, packet: RamsesPacket) -> str | None:
+        """Decide if a parsed packet is worth decoding, returns the reason to drop it or None"""
+        if packet.code == "042F":  # startup message, used for fan discovery
+            return None
+        if packet.signal_strength == 0:
+            """Don't call handler function on something we send ourselves (TODO: needed w/ timed fan with 22F3)"""
+            return "echo"
+        if packet.src not in self._own_devices:  # only continue with our own devices
             if (
-                not self.co2_id
+                self._co2 == NO_DEVICE
                 and packet.type == "I"
                 and packet.code == "31E0"
                 and packet.length == 8
-                and packet.dst_id == self.fan_id
+                and packet.dst == self._fan
             ):
                 """Fan received a vent demand payload, that's our CO2 sensor, handler func will handle it"""
                 """FIXME: Should not be handled this way"""
                 self.co2_id = packet.src_id
+                self._update_devices()
                 _LOGGER.debug(f"Discovered CO2 sensor ({self.co2_id})")
             else:
-                return
-        if (
-            packet.signal_strength == 0 and packet.code != "042F"
-        ):  # 042F is for testing only, where I publish it myself
-            """Don't call handler function on something we send ourselves (TODO: needed w/ timed fan with 22F3)"""
+                return "foreign"
+        if packet.type == "RQ":  # requests carry no state
+            return "request"
+        if CODES.lookup(packet.code) is None:  # warns once for unknown codes
+            return "unknown_code"
+        if packet.code not in self._handlers and not self._send_queue:
+            return "unhandled"
+        return None
+
+    async def _handle_ramses_packet(self, packet: RamsesPacket) -> None:
+        if (frame := packet.frame) is not None and self._dedup.is_duplicate(frame):
+            """RF repeat of a frame we just handled, packet_log still records it"""
+            self.stats["duplicate"] += 1
             return
-        if (q_packet := self._send_queue.get(packet)) is not None:
-            self._send_queue.remove(q_packet)
-        if packet.code in self._handlers:
-            self._handlers[packet.code](payload)
+        try:
+            packet.parse()
+        except RamsesPacketException as e:
+            _LOGGER.error(f"Error parsing MQTT message {packet.ts} {packet.frame}: {e}")
+            self.stats["malformed"] += 1
+            return
+        if (reason := self._admit(packet)) is not None:
+            self.stats[reason] += 1
+            return
+        self.stats["admitted"] += 1
+        q_packet = self._send_queue.get(packet)
+        handler = self._handlers.get(packet.code)
+        payload = None
+        if handler is not None or (
+            q_packet is not None and self._send_queue.has_waiters(q_packet)
+        ):
+            try:
+                payload = CODES.decoder(packet.code)(packet=packet)
+            except Exception as e:
+                if q_packet is not None:
+                    self._send_queue.fail(q_packet, e)
+                raise
+        if q_packet is not None:
+            r = q_packet.expected_response
+            if r is not None and r.tries == 1 and r.sent_at is not None:
+                self.rtt.sample(
+                    q_packet.dst, q_packet.code, self.hass.loop.time() - r.sent_at
+                )
+            self._send_queue.resolve(q_packet, payload)
+        if handler is not None:
+            handler(payload)
 
-    async def packet_log(
-        self,
-        envelope: dict,
-        path: str = "/config/packet.log",
-        max_size: int = 10_000_000,
-    ) -> None:
-        """Log raw packets to disk, rolling over at 10 MB, offloaded to executor."""
-
-        def _sync_log() -> None:
-            if self._log_f is None:
-                try:
-                    self._log_f = open(path, "a")
-                except Exception as e:
-                    _LOGGER.error("Error opening %s: %s", path, e)
-                    return
-
-            print(f"{envelope['ts']} {envelope['msg']}", file=self._log_f)
-            self._log_f.flush()
-
-            if os.path.getsize(path) > max_size:
-                try:
-                    self._log_f.close()
-                except Exception:
-                    pass
-                for i in range(10, 0, -1):  # keep up to 10 old log files
-                    src = f"{path}{'' if i == 1 else f'.{i - 1}'}"
-                    dst = f"{path}.{i}"
-                    try:
-                        os.replace(src, dst)
-                    except FileNotFoundError:
-                        continue
-                try:
-                    self._log_f = open(path, "a")
-                except Exception as e:
-                    _LOGGER.error("Error reopening %s: %s", path, e)
-
-        await self.hass.async_add_executor_job(_sync_log)
+    def packet_log(self, packet: RamsesPacket) -> None:
+        """Log the raw packet, written to disk in batches by the log's own thread"""
+        self._packet_log.write(f"{packet.ts} {packet.frame}")
@@ -1,28 +1,30 @@
 from __future__ import annotations
 
-from typing import Callable
+from collections.abc import Callable
 
 import logging
-import uuid
-import inspect
+import json
+import re
 
 from datetime import datetime
 
 _LOGGER = logging.getLogger(__name__)
 
+# RAMSES_ESP envelopes, with and without spaces: (prefix, separator, suffix)
+_ENVELOPE_LAYOUTS = (
+    ('{"ts": "', '", "msg": "', '"}'),
+    ('{"ts":"', '","msg":"', '"}'),
+)
+_DEVICE = r"(\d\d:\d{6}|--:------)"
+_FRAME = re.compile(
+    rf"(\S{{3}}) ( I|RQ|RP| W) --- {_DEVICE} {_DEVICE} {_DEVICE} ([0-9A-F]{{4}}) (\d{{3}})(?: ([0-9A-F]+))?"
+)
+
 
 class RamsesPacketException(Exception):
     pass
 
 
-class RamsesPacketData(str):
-    def __len__(self) -> int:
-        orig_len = super().__len__()
-        if orig_len % 2 != 0:
-            raise RamsesPacketException("Data has odd length")
-        return orig_len // 2
-
-
 class RamsesPacketDatetime:
     def __init__(self, dt: datetime | str) -> None:
         self.t_datetime: datetime | None
@@ -74,10 +76,106 @@ class RamsesID(str):
         return self != self.empty_address
 
 
+NO_DEVICE = -1  # handle of RamsesID.empty_address
+
+
+class RamsesDeviceTable:
+    """Interns device ids as integer handles, (type << 18) | serial like on the wire
+
+    Every NN:NNNNNN id is converted once, after that it's a dict lookup in
+    either direction. Use the handles for comparisons, the RamsesID for
+    anything Home-Assistant facing (device identifiers, config entries)."""
+
+    def __init__(self) -> None:
+        self._handles: dict[str, int] = {RamsesID.empty_address: NO_DEVICE}
+        self._ids: dict[int, RamsesID] = {NO_DEVICE: RamsesID()}
+
+    def __len__(self) -> int:
+        return len(self._ids) - 1
+
+    def handle(self, device_id: str | None) -> int:
+        """Convert (say) '29:224547' to 7826723"""
+        try:
+            return self._handles[device_id or RamsesID.empty_address]
+        except KeyError:
+            pass
+        assert device_id is not None
+        dev_type, sep, serial = device_id.partition(":")
+        if not (
+            sep
+            and len(dev_type) == 2
+            and len(serial) == 6
+            and dev_type.isdigit()
+            and serial.isdigit()
+            and int(dev_type) < 64
+            and int(serial) <= 0x03FFFF
+        ):
+            raise RamsesPacketException(f"Invalid device id: {device_id}")
+        handle = (int(dev_type) << 18) | int(serial)
+        self._handles[device_id] = handle
+        self._ids.setdefault(handle, RamsesID(device_id))
+        return handle
+
+    def id(self, handle: int, intern: bool = True) -> RamsesID:
+        """Convert (say) 7826723 to '29:224547'
+
+        Without intern, an id that isn't in the table yet isn't added (ids
+        found in payloads, rather than addresses)."""
+        try:
+            return self._ids[handle]
+        except KeyError:
+            pass
+        if not 0 <= handle <= 0xFFFFFF:
+            raise RamsesPacketException(f"Invalid device handle: {handle}")
+        device_id = RamsesID(f"{handle >> 18:02d}:{handle & 0x03FFFF:06d}")
+        if intern:
+            self._handles[device_id] = handle
+            self._ids[handle] = device_id
+        return device_id
+
+
+DEVICES = RamsesDeviceTable()
+
+
 class RamsesPacket:
+    """A Ramses II packet, either received (from an envelope) or to be sent
+
+    Received packets only keep the raw envelope strings, the frame is split
+    into fields on first access of one of them. The packet_id is assigned by
+    RamsesPacketQueue, only outbound packets that expect a response get one."""
+
+    __slots__ = (
+        "_frame",
+        "_ts",
+        "ann",
+        "code",
+        "data",
+        "dst",
+        "expected_response",
+        "length",
+        "packet_id",
+        "signal_strength",
+        "src",
+        "timestamp",
+        "type",
+    )
+
+    _frame_fields = frozenset(
+        {
+            "signal_strength",
+            "type",
+            "src",
+            "dst",
+            "ann",
+            "code",
+            "length",
+            "data",
+        }
+    )
+
     def __init__(
         self,
-        envelope: dict = {},
+        envelope: dict | None = None,
         src_id: RamsesID = RamsesID(),
         dst_id: RamsesID = RamsesID(),
         ann_id: RamsesID = RamsesID(),
@@ -85,43 +183,96 @@ class RamsesPacket:
         code: str = "",
         data: str = "",
     ) -> None:
-        self._timestamp = RamsesPacketDatetime(datetime.now())
-        self.signal_strength = -1
+        self.expected_response: RamsesPacketResponse | None = None
+        self.packet_id: int | None = None
+        if envelope:
+            self._ts: str | None = envelope["ts"]
+            self._frame: str | None = envelope["msg"]
+            return  # the other fields are filled in by __getattr__
+        if len(data) % 2 != 0:
+            raise RamsesPacketException("Data has odd length")
+        self._ts = None
+        self._frame = None
+        self.timestamp: RamsesPacketDatetime | None = None
+        self.signal_strength: int = -1
         self.type = type
-        self.src_id = src_id
-        self.dst_id = dst_id
-        self.ann_id = ann_id
+        self.src: int = DEVICES.handle(src_id)
+        self.dst: int = DEVICES.handle(dst_id)
+        self.ann: int = DEVICES.handle(ann_id)
         self.code = code
-        self.expected_response: RamsesPacketResponse | None = None
-        self.length: int = 0
-        self.packet_id = uuid.uuid4().hex
+        self.length: int = len(data) // 2
         self.data = data
-        self._envelope = envelope
-        if self._envelope:
+
+    def __getattr__(self, name: str) -> object:
+        """Only called for unset slots, ie the fields of a received packet on first access"""
+        if name == "timestamp" and self._ts is not None:
+            self.timestamp = RamsesPacketDatetime(self._ts)
+            return self.timestamp
+        if name in self._frame_fields and self._frame is not None:
             self.parse()
+            return object.__getattribute__(self, name)
+        raise AttributeError(
+            f"'{self.__class__.__name__}' object has no attribute '{name}'"
+        )
+
+    @classmethod
+    def from_payload(cls, payload: bytes | str) -> RamsesPacket:
+        """Build a packet from a RAMSES_ESP MQTT payload, json is only used for unexpected shapes"""
+        if isinstance(payload, (bytes, bytearray)):
+            payload = payload.decode()
+        if payload.count('"') == 8 and "\\" not in payload:  # 2 keys, 2 values
+            for prefix, separator, suffix in _ENVELOPE_LAYOUTS:
+                if payload.startswith(prefix) and payload.endswith(suffix):
+                    ts, sep, msg = payload[len(prefix) : -len(suffix)].partition(
+                        separator
+                    )
+                    if sep:
+                        return cls(envelope={"ts": ts, "msg": msg})
+        try:
+            envelope = json.loads(payload)
+        except ValueError as e:
+            raise RamsesPacketException(f"Invalid envelope: {e}")
+        if not (
+            isinstance(envelope, dict)
+            and isinstance(envelope.get("ts"), str)
+            and isinstance(envelope.get("msg"), str)
+        ):
+            raise RamsesPacketException(f"Invalid envelope: {payload}")
+        return cls(envelope={"ts": envelope["ts"], "msg": envelope["msg"]})
+
+    @property
+    def ts(self) -> str | None:
+        """Timestamp string of a received packet, as in the envelope"""
+        return self._ts
+
+    @property
+    def frame(self) -> str | None:
+        """Raw frame of a received packet, as in the envelope"""
+        return self._frame
 
     def __repr__(self) -> str:
-        all_attr = {k: v for k, v in vars(self).items() if not k.startswith("_")}
-        all_prop = {
-            k: getattr(self, k)
-            for k, v in inspect.getmembers(
-                type(self), lambda v: isinstance(v, property)
-            )
-        }
-        return str({**all_attr, **all_prop})
+        return str(
+            {
+                k: DEVICES.id(getattr(self, k))
+                if k in ("src", "dst", "ann")
+                else getattr(self, k)
+                for cls in reversed(type(self).__mro__)
+                for k in getattr(cls, "__slots__", ())
+                if not k.startswith("_")
+            }
+        )
 
     @property
-    def data(self) -> str | RamsesPacketData | None:
-        return self._data
+    def src_id(self) -> RamsesID:
+        return DEVICES.id(self.src)
 
-    @data.setter
-    def data(self, value: str) -> None:
-        if not value:
-            self.length = 0
-            self._data = RamsesPacketData()
-            return
-        self._data = RamsesPacketData(value)
-        self.length = len(self._data)
+    @property
+    def dst_id(self) -> RamsesID:
+        return DEVICES.id(self.dst)
+
+    @property
+    def ann_id(self) -> RamsesID:
+        return DEVICES.id(self.ann)
 
     def ramses_esp_envelope(self) -> dict:
         return {
@@ -129,31 +280,38 @@ class RamsesPacket:
         }
 
     def parse(self) -> None:
-        fields = self._envelope["msg"].split()
-        assert fields[2] == "---", "Missing dashes"
-        self.timestamp = RamsesPacketDatetime(self._envelope["ts"])
-        try:
-            self.signal_strength = int(fields[0])
-        except ValueError:
-            _LOGGER.warning(f"Signal strength == {fields[0]}")
-            self.signal_strength = -1
-        self.type = fields[1]
-        self.src_id = RamsesID(fields[3])
-        self.dst_id = RamsesID(fields[4])
-        self.ann_id = RamsesID(fields[5])
-        self.code = fields[6]
-        if int(fields[7]) > 0:
-            assert len(fields) == 9, "Wrong number of fields"
-            self.data = fields[8]
-            assert int(fields[7]) == self.length, (
-                f"Wrong length ({fields[7]} vs {self.length})"
+        """Split the frame into fields, raise RamsesPacketException if it's malformed"""
+        if self._frame is None:
+            raise RamsesPacketException("Nothing to parse")
+        if (m := _FRAME.fullmatch(self._frame)) is None:
+            raise RamsesPacketException(f"Malformed frame: {self._frame}")
+        rssi, verb, src, dst, ann, code, length, data = m.groups("")
+        if len(data) != int(length) * 2:
+            raise RamsesPacketException(
+                f"Wrong length ({length} vs {len(data) // 2}): {self._frame}"
             )
+        if rssi.isdigit():
+            self.signal_strength = int(rssi)
         else:
-            assert len(fields) == 8, "No data expected!"
-            self.data = ""
+            _LOGGER.warning(f"Signal strength == {rssi}")
+            self.signal_strength = -1
+        self.type = verb.lstrip()
+        self.src = DEVICES.handle(src)
+        self.dst = DEVICES.handle(dst)
+        self.ann = DEVICES.handle(ann)
+        self.code = code
+        self.length = len(data) // 2
+        self.data = data
 
 
 class RamsesPacketResponse(RamsesPacket):
+    """What a sent packet expects in return, and how long/often to wait for it
+
+    timeout None means it's derived from measured round trip times. tries and
+    sent_at are kept up to date by RamsesESP when (re)transmitting."""
+
+    __slots__ = ("cancel_retry_handler", "max_retries", "sent_at", "timeout", "tries")
+
     def __init__(
         self,
         src_id: RamsesID = RamsesID(),
@@ -162,14 +320,16 @@ class RamsesPacketResponse(RamsesPacket):
         type: str = "",
         code: str = "",
         max_retries: int = 2,
-        timeout: int = 2,
+        timeout: float | None = None,
     ) -> None:
         super().__init__(
             src_id=src_id, dst_id=dst_id, ann_id=ann_id, type=type, code=code
         )
         self.max_retries: int = max_retries
-        self.timeout: int = timeout
+        self.timeout: float | None = timeout
         self.cancel_retry_handler: Callable[[], None] | None = None
+        self.tries: int = 0
+        self.sent_at: float | None = None
 
     def __eq__(self, b: object) -> bool:
         """Compare expected response to response"""
@@ -178,6 +338,6 @@ class RamsesPacketResponse(RamsesPacket):
         return (
             ((not self.type) or self.type == b.type)
             and ((not self.code) or self.code == b.code)
-            and ((not self.src_id) or self.src_id == b.src_id)
-            and ((not self.dst_id) or self.dst_id == b.dst_id)
+            and (self.src == NO_DEVICE or self.src == b.src)
+            and (self.dst == NO_DEVICE or self.dst == b.dst)
         )
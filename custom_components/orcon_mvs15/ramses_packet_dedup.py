@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+
+
+class RamsesPacketDedup:
+    """Remember recently received frames to suppress RF repeats
+
+    Frames are keyed without the RSSI, so the same transmission reported twice
+    by the stick, or repeated in a burst by a remote, is only seen once per
+    window. The cache is bounded both by age (window) and by size (LRU).
+    clock gives the time in seconds when is_duplicate() isn't told."""
+
+    def __init__(
+        self,
+        window: float = 2.0,
+        max_size: int = 256,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.window = window
+        self.max_size = max_size
+        self.clock = clock
+        self._seen: OrderedDict[str, float] = OrderedDict()
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(window={self.window}, size={len(self)})"
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def is_duplicate(self, frame: str, now: float | None = None) -> bool:
+        """True if the frame (minus RSSI) was seen less than window seconds ago"""
+        if self.window <= 0:
+            return False
+        if now is None:
+            now = self.clock()
+        key = frame[4:]
+        seen = self._seen
+        if (last := seen.get(key)) is not None and now - last < self.window:
+            return True  # window runs from the first sighting, not the last repeat
+        seen[key] = now
+        seen.move_to_end(key)
+        while seen:  # oldest first, stop at the first one still in the window
+            oldest = next(iter(seen.values()))
+            if now - oldest < self.window and len(seen) <= self.max_size:
+                break
+            seen.popitem(last=False)
+        return False
+
+    def clear(self) -> None:
+        self._seen.clear()
+
+
+if __name__ == "__main__":
+    d = RamsesPacketDedup(window=2.0, max_size=2)
+    frame = "045  I --- 29:163058 29:224547 --:------ 22F1 003 000304"
+
+    print("=== repeat within window")
+    assert not d.is_duplicate(frame, now=0.0)
+    assert d.is_duplicate("060" + frame[3:], now=0.5), "RSSI should not matter"
+    assert d.is_duplicate(frame, now=1.9)
+
+    print("=== repeat after window")
+    assert not d.is_duplicate(frame, now=2.0)
+
+    print("=== bounded size")
+    d.is_duplicate(frame.replace("000304", "000204"), now=2.1)
+    d.is_duplicate(frame.replace("000304", "000404"), now=2.2)
+    assert len(d) == 2, f"len is {len(d)}"
+    assert not d.is_duplicate(frame, now=2.3), "evicted frame is still cached"
+
+    print("=== disabled")
+    d = RamsesPacketDedup(window=0)
+    assert not d.is_duplicate(frame) and not d.is_duplicate(frame)
+
+    print("=== Done!")
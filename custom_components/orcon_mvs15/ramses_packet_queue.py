@@ -1,24 +1,48 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import itertools
 
+from collections import Counter
 from typing import Iterator
 
 try:
-    from .ramses_packet import RamsesPacket
+    from .ramses_packet import NO_DEVICE, RamsesPacket
 except ImportError:
     pass  # for __main__
 
 _LOGGER = logging.getLogger(__name__)
 
+_packet_ids = itertools.count(1)
+
 
 class RamsesPacketQueueException(Exception):
     pass
 
 
 class RamsesPacketQueue:
+    """Outgoing packets waiting for their expected response
+
+    Pending packets are indexed on the (type, code, src) of their expected
+    response. Wildcard fields (empty type/code, no src) are indexed as such,
+    and the combinations of wildcards in use are tracked so that looking up a
+    received packet costs one dict probe per combination, normally just one.
+    Only dst is compared within a bucket. Don't change expected_response of a
+    queued packet.
+
+    Pending packets are also indexed on their own (type, code, src, dst, data),
+    see pending(), so identical requests can share one transmission.
+
+    Callers waiting for a response attach a future to the pending packet, see
+    add_waiter(), resolve() and fail()."""
+
     def __init__(self) -> None:
-        self._queue: dict = {}
+        self._queue: dict[int, RamsesPacket] = {}
+        self._index: dict[tuple[str, str, int], dict[int, RamsesPacket]] = {}
+        self._masks: Counter[tuple[bool, bool, bool]] = Counter()
+        self._requests: dict[tuple[str, str, int, int, str], RamsesPacket] = {}
+        self._waiters: dict[int, list[asyncio.Future]] = {}
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}({self._queue})"
@@ -30,18 +54,61 @@ class RamsesPacketQueue:
         return iter(self._queue.values())
 
     def __contains__(self, packet: RamsesPacket) -> bool:
-        return packet.packet_id in self._queue
+        return packet.packet_id is not None and packet.packet_id in self._queue
 
-    def __setitem__(self, packet_id: str, packet: RamsesPacket) -> None:
+    def __setitem__(self, packet_id: int, packet: RamsesPacket) -> None:
+        if packet_id in self._queue:
+            self._unindex(self._queue[packet_id])
         self._queue[packet_id] = packet
+        mask, key = self._key(packet)
+        self._index.setdefault(key, {})[packet_id] = packet
+        self._masks[mask] += 1
+        self._requests.setdefault(self._request_key(packet), packet)
 
     def __delitem__(self, packet: RamsesPacket) -> None:
         if packet.packet_id in self._queue:
-            self._call_cancel_retry_handler(self._queue[packet.packet_id])
-            del self._queue[packet.packet_id]
+            packet_id = self._queued_id(packet)
+            q_packet = self._queue.pop(packet_id)
+            self._call_cancel_retry_handler(q_packet)
+            self._unindex(q_packet)
+            for waiter in self._waiters.pop(packet_id, ()):
+                waiter.cancel()
         else:
             raise KeyError(f"__delitem__: Packet ID {packet.packet_id} not found")
 
+    @staticmethod
+    def _queued_id(packet: RamsesPacket) -> int:
+        """packet_id of a packet that went through add()"""
+        if packet.packet_id is None:
+            raise RamsesPacketQueueException(f"Never queued: {packet}")
+        return packet.packet_id
+
+    @staticmethod
+    def _key(
+        packet: RamsesPacket,
+    ) -> tuple[tuple[bool, bool, bool], tuple[str, str, int]]:
+        """Wildcard mask and index key of the expected response of packet"""
+        r = packet.expected_response
+        assert r is not None, f"Packet w/o expected_response: {packet}"
+        return (bool(r.type), bool(r.code), r.src != NO_DEVICE), (r.type, r.code, r.src)
+
+    @staticmethod
+    def _request_key(packet: RamsesPacket) -> tuple[str, str, int, int, str]:
+        return (packet.type, packet.code, packet.src, packet.dst, packet.data)
+
+    def _unindex(self, packet: RamsesPacket) -> None:
+        request_key = self._request_key(packet)
+        if self._requests.get(request_key) is packet:
+            del self._requests[request_key]
+        mask, key = self._key(packet)
+        bucket = self._index[key]
+        del bucket[self._queued_id(packet)]
+        if not bucket:
+            del self._index[key]
+        self._masks[mask] -= 1
+        if not self._masks[mask]:
+            del self._masks[mask]
+
     def _call_cancel_retry_handler(self, packet: RamsesPacket) -> None:
         if packet.expected_response is not None and callable(
             packet.expected_response.cancel_retry_handler
@@ -56,34 +123,91 @@ class RamsesPacketQueue:
         assert packet.expected_response, (
             f"Adding packet w/o expected_response: {packet}"
         )
+        if packet.packet_id is None:
+            packet.packet_id = next(_packet_ids)
         if packet not in self:
             self[packet.packet_id] = packet
         else:
             _LOGGER.debug(f"add: Already in queue: {packet.packet_id}")
 
+    def pending(self, packet: RamsesPacket) -> RamsesPacket | None:
+        """Queued packet with the same type, code, src, dst and data as packet"""
+        return self._requests.get(self._request_key(packet))
+
     def get(self, packet: RamsesPacket) -> RamsesPacket | None:
+        """Oldest pending packet that packet is the expected response of"""
         if not self:
             _LOGGER.debug("get: Queue is empty")
             return None
-        for q in self:
-            if q.expected_response == packet:
-                return q
-        _LOGGER.debug(
-            f"get: Not found in queue: {packet.type} {packet.code} {packet.src_id}->{packet.dst_id}"
-        )
-        return None
+        found: RamsesPacket | None = None
+        found_id = 0
+        for has_type, has_code, has_src in self._masks:
+            bucket = self._index.get(
+                (
+                    packet.type if has_type else "",
+                    packet.code if has_code else "",
+                    packet.src if has_src else NO_DEVICE,
+                )
+            )
+            if bucket is None:
+                continue
+            for packet_id, q in bucket.items():  # insertion order, so oldest first
+                dst = q.expected_response.dst  # type: ignore[union-attr]
+                if dst == NO_DEVICE or dst == packet.dst:
+                    if found is None or packet_id < found_id:
+                        found, found_id = q, packet_id
+                    break
+        if found is None and _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug(
+                f"get: Not found in queue: {packet.type} {packet.code} {packet.src_id}->{packet.dst_id}"
+            )
+        return found
 
     def remove(self, packet: RamsesPacket) -> None:
         del self[packet]
 
+    def add_waiter(self, packet: RamsesPacket, waiter: asyncio.Future) -> None:
+        """Have waiter resolved with the response to the queued packet"""
+        if packet not in self:
+            raise RamsesPacketQueueException(f"add_waiter: Not in queue: {packet}")
+        self._waiters.setdefault(self._queued_id(packet), []).append(waiter)
+
+    def has_waiters(self, packet: RamsesPacket) -> bool:
+        return packet.packet_id in self._waiters
+
+    def resolve(self, packet: RamsesPacket, result: object) -> None:
+        """Remove the answered packet, passing result to everyone waiting on it"""
+        for waiter in self._waiters.pop(self._queued_id(packet), ()):
+            if not waiter.done():  # the caller may have given up
+                waiter.set_result(result)
+        del self[packet]
+
+    def fail(self, packet: RamsesPacket, exc: Exception) -> None:
+        """Remove the packet, raising exc in everyone waiting on it"""
+        for waiter in self._waiters.pop(self._queued_id(packet), ()):
+            if not waiter.done():
+                waiter.set_exception(exc)
+        del self[packet]
+
     def clear(self) -> None:
-        for packet_id in list(self._queue):
-            del self._queue[packet_id]
+        for waiters in self._waiters.values():
+            for waiter in waiters:
+                waiter.cancel()
+        self._waiters.clear()
+        self._queue.clear()
+        self._index.clear()
+        self._masks.clear()
+        self._requests.clear()
 
 
 if __name__ == "__main__":
     import sys
-    from ramses_packet import RamsesPacket, RamsesPacketResponse, RamsesID  # type: ignore[no-redef]
+    from ramses_packet import (  # type: ignore[no-redef]
+        RamsesPacket,
+        RamsesPacketResponse,
+        RamsesID,
+        NO_DEVICE,
+    )
 
     _LOGGER = logging.getLogger()
     _LOGGER.setLevel(logging.DEBUG)
@@ -123,6 +247,18 @@ if __name__ == "__main__":
     q.add(tx)
     assert len(q) == 1, f"len after add is {len(q)}"
 
+    print("=== pending")
+    dup = RamsesPacket(
+        src_id=RamsesID("18:149960"),
+        dst_id=RamsesID("29:224547"),
+        type="RQ",
+        code="12A0",
+        data="00",
+    )
+    assert q.pending(dup) is tx, f"{dup} not pending in {q._queue}"
+    dup.data = "01"
+    assert q.pending(dup) is None, f"{dup} pending in {q._queue}"
+
     print("=== get/del (__iter__, __getitem__, __delitem__)")
     p = q.get(rx_other)
     assert p is None, (
@@ -135,8 +271,57 @@ if __name__ == "__main__":
     q.remove(p)
     assert len(q) == 0, f"len after del is {len(q)}"
 
+    print("=== wildcard dst, oldest first")
+    for _ in range(2):
+        tx = RamsesPacket(
+            src_id=RamsesID("29:163058"),
+            dst_id=RamsesID("29:224547"),
+            type=" I",
+            code="22F1",
+            data="000304",
+        )
+        tx.expected_response = RamsesPacketResponse(
+            src_id=RamsesID("29:224547"), type="I", code="31D9"
+        )
+        q.add(tx)
+    rx = RamsesPacket(
+        envelope={
+            "ts": "2025-06-01T17:10:51.271376+02:00",
+            "msg": "045  I --- 29:224547 --:------ 29:224547 31D9 003 000A00",
+        }
+    )
+    p = q.get(rx)
+    assert p is not None and p.packet_id == min(x.packet_id for x in q), (
+        f"expected oldest match for {rx} in {q._queue}"
+    )
+    q.remove(p)
+    assert q.get(rx) is not None and len(q) == 1, f"len after del is {len(q)}"
+
+    print("=== waiters")
+
+    async def _waiters(p: RamsesPacket) -> None:
+        answered: asyncio.Future[str] = asyncio.Future()
+        failed: asyncio.Future[str] = asyncio.Future()
+        cancelled: asyncio.Future[str] = asyncio.Future()
+        q.add_waiter(p, answered)
+        q.resolve(p, "response")
+        assert answered.result() == "response" and p not in q
+        q.add(p)
+        q.add_waiter(p, failed)
+        q.fail(p, TimeoutError("no response"))
+        assert isinstance(failed.exception(), TimeoutError) and len(q) == 0
+        q.add(p)
+        q.add_waiter(p, cancelled)
+        q.clear()
+        assert cancelled.cancelled()
+
+    p = q.get(rx)
+    assert p is not None
+    asyncio.run(_waiters(p))
+
     print("=== clear")
     q.clear()
     assert len(q) == 0, f"len after clear is {len(q)}"
+    assert q.get(rx) is None, "match after clear"
 
     print("=== Done!")
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+from collections.abc import Awaitable, Callable
+
+from .ramses_packet import RamsesPacket
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class RamsesRetrySchedulerException(Exception):
+    pass
+
+
+class RamsesRetryScheduler:
+    """Response deadlines of all pending packets, served by one task
+
+    Deadlines live in a heap, the task sleeps until the earliest one and calls
+    on_expiry for it inline. Cancelling only forgets the packet's current
+    deadline (O(1)), its heap entry is skipped once it reaches the top."""
+
+    def __init__(self, on_expiry: Callable[[RamsesPacket], Awaitable[None]]) -> None:
+        self._on_expiry = on_expiry
+        self._heap: list[tuple[float, int, RamsesPacket]] = []
+        self._armed: dict[int, int] = {}  # packet_id -> seq of its live heap entry
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._armed)
+
+    def schedule(self, packet: RamsesPacket, delay: float) -> None:
+        """(Re)arm the deadline of packet, delay seconds from now"""
+        if packet.packet_id is None:
+            raise RamsesRetrySchedulerException(f"Packet has no packet_id: {packet}")
+        loop = asyncio.get_running_loop()
+        if self._task is None:
+            self._task = loop.create_task(self._run(), name="ramses_esp_retries")
+        seq = next(self._seq)
+        self._armed[packet.packet_id] = seq
+        heapq.heappush(self._heap, (loop.time() + delay, seq, packet))
+        if self._heap[0][1] == seq:  # new earliest deadline
+            self._wakeup.set()
+
+    def cancel(self, packet: RamsesPacket) -> None:
+        self._armed.pop(packet.packet_id, None)  # type: ignore[arg-type]
+
+    def stop(self) -> None:
+        """Cancel the task and forget all deadlines"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._heap.clear()
+        self._armed.clear()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        heap = self._heap
+        while True:
+            while heap and self._armed.get(heap[0][2].packet_id) != heap[0][1]:  # type: ignore[arg-type]
+                heapq.heappop(heap)  # cancelled or re-armed since
+            self._wakeup.clear()
+            if not heap:
+                await self._wakeup.wait()
+                continue
+            deadline, _, packet = heap[0]
+            if deadline > loop.time():
+                timer = loop.call_at(deadline, self._wakeup.set)
+                await self._wakeup.wait()
+                timer.cancel()
+                continue
+            heapq.heappop(heap)
+            del self._armed[packet.packet_id]  # type: ignore[arg-type]
+            try:
+                await self._on_expiry(packet)
+            except Exception:
+                _LOGGER.exception(f"Failed to handle timeout of {packet}")
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+
+from .ramses_packet import DEVICES
+
+INITIAL_RTO = 2.0  # seconds, until there's a measurement
+MIN_RTO = 0.5
+MAX_RTO = 60.0  # battery powered devices can sleep for a while
+JITTER = 0.25  # backoff is stretched by up to this fraction
+
+
+@dataclass(slots=True)
+class RttEstimate:
+    srtt: float
+    rttvar: float
+    samples: int = 1
+
+    @property
+    def rto(self) -> float:
+        return min(MAX_RTO, max(MIN_RTO, self.srtt + 4 * self.rttvar))
+
+
+class RamsesRttEstimator:
+    """Smoothed round trip times per (device, code), like TCP (RFC 6298)
+
+    Only responses to packets that were sent once are measured, after a retry
+    it's unknown which transmission was answered (Karn's algorithm)."""
+
+    def __init__(self) -> None:
+        self._estimates: dict[tuple[int, str], RttEstimate] = {}
+
+    def __len__(self) -> int:
+        return len(self._estimates)
+
+    def sample(self, device: int, code: str, rtt: float) -> None:
+        if (e := self._estimates.get((device, code))) is None:
+            self._estimates[device, code] = RttEstimate(srtt=rtt, rttvar=rtt / 2)
+            return
+        e.rttvar += (abs(e.srtt - rtt) - e.rttvar) / 4
+        e.srtt += (rtt - e.srtt) / 8
+        e.samples += 1
+
+    def rto(self, device: int, code: str) -> float:
+        """Time to wait for a response on the first try"""
+        e = self._estimates.get((device, code))
+        return INITIAL_RTO if e is None else e.rto
+
+    def backoff(self, rto: float, tries: int) -> float:
+        """Time to wait for a response on try number tries (1 based), doubling each retry"""
+        return min(MAX_RTO, rto * 2 ** (tries - 1)) * random.uniform(1, 1 + JITTER)
+
+    def estimates(self) -> dict[str, dict[str, float | int]]:
+        """Current estimates in ms, keyed on '<device id> <code>'"""
+        return {
+            f"{DEVICES.id(device)} {code}": {
+                "srtt": round(e.srtt * 1000),
+                "rttvar": round(e.rttvar * 1000),
+                "rto": round(e.rto * 1000),
+                "samples": e.samples,
+            }
+            for (device, code), e in sorted(self._estimates.items())
+        }
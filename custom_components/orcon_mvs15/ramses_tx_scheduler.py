@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from collections.abc import Awaitable, Callable
+from enum import IntEnum
+
+from .ramses_packet import RamsesPacket
+
+_LOGGER = logging.getLogger(__name__)
+
+BIT_RATE = 38_400  # bps on air
+FRAME_OVERHEAD = 14 + 8  # header, addresses, code, length, checksum + preamble/sync
+
+
+class TxPriority(IntEnum):
+    """Transmit lanes, lowest value goes first"""
+
+    COMMAND = 0
+    RETRY = 1
+    POLL = 2
+
+
+class RamsesTxScheduler:
+    """Paces outbound packets, one task sending them in priority order
+
+    Packets wait in a lane per TxPriority. Between two transmissions there's
+    at least min_gap seconds, and the estimated airtime within the last window
+    seconds stays below duty_cycle (1% for 868 MHz). Polls that waited longer
+    than max_poll_age, or that don't fit in max_polls, are handed to on_evict
+    instead of being sent."""
+
+    def __init__(
+        self,
+        send: Callable[[RamsesPacket], Awaitable[bool]],
+        on_evict: Callable[[RamsesPacket], None],
+        min_gap: float = 0.2,
+        duty_cycle: float = 0.01,
+        window: float = 3600.0,
+        max_polls: int = 8,
+        max_poll_age: float = 30.0,
+    ) -> None:
+        self._send = send
+        self._on_evict = on_evict
+        self.min_gap = min_gap
+        self.budget = duty_cycle * window
+        self.window = window
+        self.max_polls = max_polls
+        self.max_poll_age = max_poll_age
+        self._lanes: tuple[deque[tuple[float, RamsesPacket]], ...] = tuple(
+            deque() for _ in TxPriority
+        )
+        self._airtime: deque[tuple[float, float]] = deque()  # (sent at, seconds)
+        self.airtime_used = 0.0  # seconds, within the last window
+        self._last_tx = float("-inf")
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return sum(len(lane) for lane in self._lanes)
+
+    @staticmethod
+    def airtime(packet: RamsesPacket) -> float:
+        """Estimated seconds on air, Manchester encoded with start/stop bits"""
+        return (FRAME_OVERHEAD + packet.length) * 2 * 10 / BIT_RATE
+
+    def submit(self, packet: RamsesPacket, priority: TxPriority) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is None:
+            self._task = loop.create_task(self._run(), name="ramses_esp_tx")
+        lane = self._lanes[priority]
+        lane.append((loop.time(), packet))
+        if priority == TxPriority.POLL and len(lane) > self.max_polls:
+            self._on_evict(lane.popleft()[1])
+        self._wakeup.set()
+
+    def stop(self) -> None:
+        """Cancel the task, queued packets are dropped"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for lane in self._lanes:
+            lane.clear()
+
+    def _evict_stale_polls(self, now: float) -> None:
+        polls = self._lanes[TxPriority.POLL]
+        while polls and now - polls[0][0] > self.max_poll_age:
+            self._on_evict(polls.popleft()[1])
+
+    def _ready_at(self, packet: RamsesPacket, now: float) -> float:
+        """Earliest time packet can be sent without breaking the gap or airtime budget"""
+        airtime = self._airtime
+        while airtime and now - airtime[0][0] >= self.window:
+            self.airtime_used -= airtime.popleft()[1]
+        ready = self._last_tx + self.min_gap
+        needed = self.airtime_used + self.airtime(packet) - self.budget
+        for sent_at, seconds in airtime:  # wait for enough old airtime to expire
+            if needed <= 0:
+                break
+            needed -= seconds
+            ready = max(ready, sent_at + self.window)
+        return ready
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            now = loop.time()
+            self._evict_stale_polls(now)
+            lane = next((lane for lane in self._lanes if lane), None)
+            if lane is None:
+                await self._wakeup.wait()
+                continue
+            if (ready := self._ready_at(lane[0][1], now)) > now:
+                await asyncio.sleep(ready - now)
+                continue  # something more urgent may have come in meanwhile
+            _, packet = lane.popleft()
+            try:
+                if not await self._send(packet):
+                    continue  # no longer needed, nothing went on air
+            except Exception:
+                _LOGGER.exception(f"Failed to transmit {packet}")
+                continue
+            self._last_tx = loop.time()
+            self._airtime.append((self._last_tx, self.airtime(packet)))
+            self.airtime_used += self._airtime[-1][1]
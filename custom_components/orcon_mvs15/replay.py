@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import Counter, defaultdict
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
+from typing import TYPE_CHECKING, cast
+
+from homeassistant.components.mqtt import ReceiveMessage
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import device_registry as dr
+
+from .coordinator import OrconMVS15DataUpdateCoordinator
+from .handlers import DataHandlers
+from .models import OrconMVS15Config, OrconMVS15RuntimeData
+from .mqtt import MQTT
+from .packet_log import envelope, read_lines
+from .ramses_esp import RamsesESP
+from .ramses_packet import RamsesID, RamsesPacket
+
+if TYPE_CHECKING:
+    from homeassistant.config_entries import ConfigEntry
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ReplayException(Exception):
+    pass
+
+
+class ReplayMQTT(MQTT):
+    """Local stand-in for the MQTT integration
+
+    Envelopes are delivered to the subscribed handler as a broker would, what
+    RamsesESP publishes is kept in published instead of going on air."""
+
+    def __init__(self, hass: HomeAssistant, gateway_id: RamsesID) -> None:
+        super().__init__(hass, "RAMSES/REPLAY", gateway_id)
+        self.published: list[dict] = []
+        self._subscriptions: dict[str, Callable] = {}
+
+    async def _subscribe(self, topic: str, handler: Callable) -> None:
+        self._subscriptions[topic] = handler
+        self._mqtt_unsubs.append(partial(self._subscriptions.pop, topic, None))
+
+    async def deliver(self, envelope: dict[str, str]) -> None:
+        if (handler := self._subscriptions.get(self.sub_topic)) is None:
+            raise ReplayException(f"Nothing subscribed to {self.sub_topic}")
+        await handler(
+            ReceiveMessage(
+                topic=self.sub_topic,
+                payload=json.dumps(envelope),
+                qos=0,
+                retain=False,
+                subscribed_topic=self.sub_topic,
+                timestamp=time.monotonic(),
+            )
+        )
+
+    async def publish(self, ramses_packet: RamsesPacket) -> None:
+        self.published.append(ramses_packet.ramses_esp_envelope())
+
+
+@dataclass
+class ReplayEntry:
+    """The part of a ConfigEntry that DataHandlers uses"""
+
+    runtime_data: OrconMVS15RuntimeData
+
+
+class LogClock:
+    """Time of the packet being replayed, RF repeats are seconds apart in the log, not now"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class StageTimer:
+    """Latency samples (ns) per ingest stage"""
+
+    def __init__(self) -> None:
+        self.samples: defaultdict[str, list[int]] = defaultdict(list)
+
+    def add(self, stage: str, ns: int) -> None:
+        self.samples[stage].append(ns)
+
+    def report(self) -> dict[str, dict[str, float]]:
+        """Per stage: total in ms, mean and percentiles in µs"""
+        report = {}
+        for stage, samples in self.samples.items():
+            samples = sorted(samples)
+            report[stage] = {
+                "total_ms": round(sum(samples) / 1e6, 1),
+                "mean_us": round(sum(samples) / len(samples) / 1e3, 1),
+                "p50_us": round(samples[len(samples) // 2] / 1e3, 1),
+                "p99_us": round(samples[len(samples) * 99 // 100] / 1e3, 1),
+                "max_us": round(samples[-1] / 1e3, 1),
+            }
+        return report
+
+
+async def replay(
+    paths: Iterable[str],
+    config: OrconMVS15Config,
+    speed: float = 0,
+    via_mqtt: bool = True,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> dict[str, object]:
+    """Feed recorded packet logs through RamsesESP, DataHandlers and the coordinators
+
+    Runs on a bare Home Assistant core (nothing loaded but the device registry)
+    in a scratch config dir. speed 1 replays in real time, N N times faster and
+    0 as fast as possible. via_mqtt delivers the envelopes through the MQTT
+    message handler, otherwise the parsed packets go to the packet handler
+    directly. Returns throughput, stage latencies, RamsesESP diagnostics and
+    the final coordinator data."""
+    if not config.gateway_id:
+        raise ReplayException(
+            "The gateway id is needed to tell responses from requests"
+        )
+    with tempfile.TemporaryDirectory(prefix="orcon_replay_") as config_dir:
+        hass = HomeAssistant(config_dir)
+        await dr.async_load(hass)
+        runtime = OrconMVS15RuntimeData(config=config)
+        updates: Counter[str] = Counter()
+        coordinators: dict[str, OrconMVS15DataUpdateCoordinator] = {}
+        for name in ("fan", "co2", "rem"):
+            coordinator = OrconMVS15DataUpdateCoordinator(hass, None)
+            await coordinator.async_refresh()
+            coordinator.async_add_listener(partial(updates.update, [name]))  # +1
+            coordinators[name] = coordinator
+        runtime.fan_coordinator = coordinators["fan"]
+        runtime.co2_coordinator = coordinators["co2"]
+        runtime.rem_coordinator = coordinators["rem"]
+
+        mqtt = ReplayMQTT(hass, config.gateway_id)
+        await mqtt.init()
+        runtime.cleanup.append(mqtt.cleanup)
+        clock = LogClock()
+        esp = RamsesESP(
+            hass,
+            mqtt,
+            remote_id=config.remote_id,
+            fan_id=config.fan_id,
+            co2_id=config.co2_id,
+            gateway_id=config.gateway_id,
+            packet_log_path=os.path.join(config_dir, "packet.log"),
+            dedup_clock=clock,
+        )
+        runtime.ramses_esp = esp
+        runtime.cleanup.append(esp.cleanup)
+        dh = DataHandlers(hass, cast("ConfigEntry", ReplayEntry(runtime)))
+        for code, func in dh.pointers.items():
+            esp.add_handler(code, func)
+        await mqtt.setup(
+            esp.handle_ramses_mqtt_message, esp.handle_ramses_mqtt_version_message
+        )
+
+        timer = StageTimer()
+        packets = errors = 0
+        first_ts: float | None = None
+        ts = 0.0
+        lines = iter(read_lines(paths, since, until))
+        started = time.monotonic()
+        try:
+            while True:
+                t0 = time.perf_counter_ns()
+                if (line := next(lines, None)) is None:
+                    break
+                if (env := envelope(line)) is None:
+                    continue
+                try:
+                    ts = clock.now = datetime.fromisoformat(env["ts"]).timestamp()
+                except ValueError:
+                    pass  # RamsesESP will complain about it
+                timer.add("read", time.perf_counter_ns() - t0)
+                if first_ts is None:
+                    first_ts = ts
+                if speed:
+                    await asyncio.sleep(
+                        max(0, started + (ts - first_ts) / speed - time.monotonic())
+                    )
+                else:
+                    await asyncio.sleep(0)  # let the schedulers and timers run
+                t1 = time.perf_counter_ns()
+                if via_mqtt:
+                    await mqtt.deliver(env)
+                    timer.add("mqtt", time.perf_counter_ns() - t1)
+                else:
+                    packet = RamsesPacket(envelope=env)
+                    t2 = time.perf_counter_ns()
+                    try:
+                        await esp._handle_ramses_packet(packet)
+                    except Exception:
+                        _LOGGER.exception(f"Failed to handle {line}")
+                        errors += 1
+                    t3 = time.perf_counter_ns()
+                    esp.packet_log(packet)
+                    timer.add("envelope", t2 - t1)
+                    timer.add("handle", t3 - t2)
+                    timer.add("log", time.perf_counter_ns() - t3)
+                packets += 1
+            await hass.async_block_till_done()
+            elapsed = time.monotonic() - started
+            return {
+                "packets": packets,
+                "errors": errors,
+                "seconds": round(elapsed, 3),
+                "packets_per_second": round(packets / elapsed) if elapsed else None,
+                "via": "mqtt" if via_mqtt else "direct",
+                "speed": speed or "max",
+                "stages": timer.report(),
+                "ramses_esp": esp.diagnostics(),
+                "published": len(mqtt.published),
+                "coordinators": {
+                    name: {
+                        "updates": updates[name],
+                        **coordinator.stats(),
+                        "data": coordinator.data,
+                    }
+                    for name, coordinator in coordinators.items()
+                },
+            }
+        finally:
+            while runtime.cleanup:
+                runtime.cleanup.pop()()
+            await hass.async_stop(force=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    """Replay packet logs: python -m custom_components.orcon_mvs15.replay --fan 29:224547 packet.log"""
+
+    parser = argparse.ArgumentParser(description="Replay RAMSES II packet logs")
+    parser.add_argument(
+        "paths", nargs="+", help="packet.log[.N[.gz|.xz]], oldest first"
+    )
+    parser.add_argument(
+        "--speed", type=float, default=0, help="1 is real time, 0 as fast as possible"
+    )
+    parser.add_argument(
+        "--direct", action="store_true", help="skip MQTT, call the packet handler"
+    )
+    parser.add_argument("--since", type=datetime.fromisoformat)
+    parser.add_argument("--until", type=datetime.fromisoformat)
+    parser.add_argument("--gateway", type=RamsesID, required=True)
+    parser.add_argument("--remote", type=RamsesID, default=RamsesID())
+    parser.add_argument("--fan", type=RamsesID, default=RamsesID())
+    parser.add_argument("--co2", type=RamsesID, default=RamsesID())
+    parser.add_argument("--debug", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING)
+
+    report = asyncio.run(
+        replay(
+            args.paths,
+            OrconMVS15Config(
+                gateway_id=args.gateway,
+                remote_id=args.remote,
+                fan_id=args.fan,
+                co2_id=args.co2,
+            ),
+            speed=args.speed,
+            via_mqtt=not args.direct,
+            since=args.since,
+            until=args.until,
+        )
+    )
+    print(json.dumps(report, indent=2, default=str))
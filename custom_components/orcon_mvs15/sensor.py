@@ -17,11 +17,13 @@ from homeassistant.const import (
 )
 from homeassistant.core import callback, CoreState, HomeAssistant
 from homeassistant.helpers.device_registry import DeviceInfo
-from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
 from .const import DOMAIN
 from .models import OrconMVS15Config
-from .coordinator import OrconMVS15DataUpdateCoordinator
+from .coordinator import (
+    OrconMVS15CoordinatorEntity,
+    OrconMVS15DataUpdateCoordinator,
+)
 from .discover_entity import DiscoverEntity
 from .ramses_packet import RamsesPacketDatetime, RamsesID
 from .ramses_esp import RamsesESP
@@ -72,7 +74,7 @@ async def async_setup_entry(
     entry.runtime_data.cleanup.append(co2_sensor.cleanup)
 
 
-class Co2Sensor(CoordinatorEntity, SensorEntity):
+class Co2Sensor(OrconMVS15CoordinatorEntity, SensorEntity):
     _attr_native_unit_of_measurement = CONCENTRATION_PARTS_PER_MILLION
     _attr_device_class = SensorDeviceClass.CO2
     _attr_state_class = SensorStateClass.MEASUREMENT
@@ -87,7 +89,7 @@ class Co2Sensor(CoordinatorEntity, SensorEntity):
         name: str,
         discovery_key: str,
     ) -> None:
-        super().__init__(coordinator)
+        super().__init__(coordinator, keys=("co2", "vent_demand"))
         self.co2_id = ramses_id
         self.ramses_esp = ramses_esp
         self.discovery_key = discovery_key
@@ -112,7 +114,9 @@ class Co2Sensor(CoordinatorEntity, SensorEntity):
         if (
             self.hass.state == CoreState.running
         ):  # only when HA is already running (ie after discovery)
-            await self.ramses_esp.init_co2(discovered_co2_id=self.co2_id)
+            self.hass.async_create_task(
+                self.ramses_esp.init_co2(discovered_co2_id=self.co2_id)
+            )
 
     @callback
     def _handle_coordinator_update(self) -> None:
@@ -127,7 +131,7 @@ class Co2Sensor(CoordinatorEntity, SensorEntity):
             self.async_write_ha_state()
 
 
-class HumiditySensor(CoordinatorEntity, SensorEntity):
+class HumiditySensor(OrconMVS15CoordinatorEntity, SensorEntity):
     _attr_native_unit_of_measurement = PERCENTAGE
     _attr_device_class = SensorDeviceClass.HUMIDITY
     _attr_state_class = SensorStateClass.MEASUREMENT
@@ -142,7 +146,7 @@ class HumiditySensor(CoordinatorEntity, SensorEntity):
         name: str,
         discovery_key: str,
     ) -> None:
-        super().__init__(coordinator)
+        super().__init__(coordinator, keys=("relative_humidity",))
         self.discovery_key = discovery_key
         self._attr_name = f"{name} relative humidity"
         self._attr_unique_id = f"orcon_mvs15_humidity_{ramses_id}"
@@ -157,7 +161,7 @@ class HumiditySensor(CoordinatorEntity, SensorEntity):
             self.async_write_ha_state()
 
 
-class SignalStrengthSensor(CoordinatorEntity, SensorEntity):
+class SignalStrengthSensor(OrconMVS15CoordinatorEntity, SensorEntity):
     _attr_native_unit_of_measurement = SIGNAL_STRENGTH_DECIBELS_MILLIWATT
     _attr_device_class = SensorDeviceClass.SIGNAL_STRENGTH
     _attr_state_class = SensorStateClass.MEASUREMENT
@@ -172,7 +176,7 @@ class SignalStrengthSensor(CoordinatorEntity, SensorEntity):
         name: str,
         discovery_key: str,
     ) -> None:
-        super().__init__(coordinator)
+        super().__init__(coordinator, keys=(f"{discovery_key}_signal_strength",))
         self.discovery_key = discovery_key
         self._attr_name = f"{name} signal strength"
         self._attr_unique_id = f"orcon_mvs15_{discovery_key}_dbm_{ramses_id}"
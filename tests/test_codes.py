@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import pytest
+
+from custom_components.orcon_mvs15.codes import Code1fc9, Code10e1
+from custom_components.orcon_mvs15.ramses_packet import DEVICES, RamsesPacket
+
+TS = "2025-06-01T17:10:49.271376+02:00"
+
+
+def _packet(frame: str) -> RamsesPacket:
+    packet = RamsesPacket(envelope={"ts": TS, "msg": frame})
+    packet.parse()
+    return packet
+
+
+@pytest.mark.parametrize(
+    ("data", "device_id"),
+    [
+        ("0022F175FF32", "29:130866"),
+        ("0022F175FF326310E0754C32", "29:130866"),  # only the first entry
+        ("0022F1FFFFFF", " " * 9),
+    ],
+)
+def test_1fc9_device_id(data: str, device_id: str) -> None:
+    packet = _packet(
+        f"050  I --- 29:163058 --:------ 29:163058 1FC9 {len(data) // 2:03d} {data}"
+    )
+    known = len(DEVICES)
+    assert Code1fc9(packet=packet).values.device_id == device_id
+    assert len(DEVICES) == known  # payload ids aren't interned
+
+
+def test_10e1_device_id() -> None:
+    packet = _packet("051 RP --- 29:224547 18:149960 --:------ 10E1 004 00736CA3")
+    assert Code10e1(packet=packet).values.device_id == "28:224419"
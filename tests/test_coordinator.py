@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+from collections.abc import Callable
+from unittest.mock import Mock
+
+import pytest
+
+from custom_components.orcon_mvs15.coordinator import (
+    OrconMVS15CoordinatorEntity,
+    OrconMVS15DataUpdateCoordinator,
+)
+
+
+@pytest.fixture
+def coordinator() -> OrconMVS15DataUpdateCoordinator:
+    coordinator = OrconMVS15DataUpdateCoordinator(Mock(), None)
+    coordinator.data = {"fan_mode": "Auto"}
+    return coordinator
+
+
+class _Entity(OrconMVS15CoordinatorEntity):
+    writes = 0
+    remove: Callable[[], None]
+
+    def async_write_ha_state(self) -> None:
+        self.writes += 1
+
+
+def _entity(coordinator: OrconMVS15DataUpdateCoordinator, *keys: str) -> _Entity:
+    """Listening like CoordinatorEntity.async_added_to_hass does"""
+    entity = _Entity(coordinator, keys)
+    entity.remove = coordinator.async_add_listener(
+        entity._handle_coordinator_update, entity.coordinator_context
+    )
+    return entity
+
+
+def _writes(*entities: _Entity) -> list[int]:
+    counts = [entity.writes for entity in entities]
+    for entity in entities:
+        entity.writes = 0
+    return counts
+
+
+def test_only_entities_of_changed_keys_are_updated(
+    coordinator: OrconMVS15DataUpdateCoordinator,
+) -> None:
+    fan = _entity(coordinator, "fan_mode", "fan_fault")
+    humidity = _entity(coordinator, "relative_humidity")
+    co2 = _entity(coordinator, "co2", "vent_demand")
+    every_change = Mock()
+    coordinator.async_add_listener(every_change)
+
+    assert coordinator.async_apply_delta({"fan_mode": "Auto"}) == set()
+    assert _writes(fan, humidity, co2) == [0, 0, 0]
+    every_change.assert_not_called()
+    assert coordinator.unchanged == 1
+
+    assert coordinator.async_apply_delta({"relative_humidity": 55}) == {
+        "relative_humidity"
+    }
+    assert _writes(fan, humidity, co2) == [0, 1, 0]
+    assert every_change.call_count == 1
+
+    # once, though both keys of the fan changed
+    changed = coordinator.async_apply_delta(
+        {"fan_mode": "Low", "fan_fault": "ok", "relative_humidity": 55}
+    )
+    assert changed == {"fan_mode", "fan_fault"}
+    assert _writes(fan, humidity, co2) == [1, 0, 0]
+    assert every_change.call_count == 2
+
+    assert coordinator.data == {
+        "fan_mode": "Low",
+        "fan_fault": "ok",
+        "relative_humidity": 55,
+    }
+    assert coordinator.last_update_success
+    assert coordinator.last_update_success_time is not None
+
+
+def test_removed_listeners_are_not_called(
+    coordinator: OrconMVS15DataUpdateCoordinator,
+) -> None:
+    fan = _entity(coordinator, "fan_mode", "fan_fault")
+    other_fan = _entity(coordinator, "fan_mode")
+    fan.remove()
+
+    coordinator.async_apply_delta({"fan_mode": "High", "fan_fault": "fault"})
+    assert _writes(fan, other_fan) == [0, 1]
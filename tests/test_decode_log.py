@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import csv
+import gzip
+import json
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from custom_components.orcon_mvs15.decode_log import (
+    LogDecoder,
+    PacketFilter,
+    decode_log,
+)
+from custom_components.orcon_mvs15.ramses_packet import RamsesPacket
+
+TS = "2025-06-01T17:10:49.271376+02:00"
+
+
+def _packet(frame: str) -> RamsesPacket:
+    packet = RamsesPacket(envelope={"ts": TS, "msg": frame})
+    packet.parse()
+    return packet
+
+
+FRAMES = [
+    "062  I --- 29:224547 --:------ 29:224547 31D9 003 000004",
+    "060  I --- 29:099029 --:------ 29:099029 1298 003 00049E",
+    "067  I --- 29:099029 29:224547 --:------ 31E0 008 0000590000006400",
+    "051 RQ --- 18:149960 29:224547 --:------ 12A0 001 00",
+    "044 RP --- 29:224547 18:149960 --:------ 12A0 002 002F",
+    "045  I --- 29:163058 29:224547 --:------ 22F1 003 000304",
+]
+START = datetime.fromisoformat("2025-06-01T00:00:00.000000+02:00")
+
+
+def _log_lines(count: int = 300) -> list[str]:
+    """Packets with runs of RF repeats (other RSSI, same frame), junk and a CRLF line"""
+    lines = []
+    for i in range(count):
+        ts = (START + timedelta(seconds=10 * i)).isoformat(timespec="microseconds")
+        frame = FRAMES[(i // 3) % len(FRAMES)]  # every frame 3 times in a row
+        if i % 3:
+            frame = f"0{40 + i % 50}{frame[3:]}"
+        lines.append(f"{ts} {frame}")
+    lines[17] = "not a packet"
+    lines[42] += "\r"
+    lines[99] = (
+        f"{lines[99][:33]}045  I --- 29:224547 --:------ 29:224547 31D9 003 0000"
+    )
+    return lines
+
+
+def _write(path: Path, lines: list[str], final_newline: bool = True) -> str:
+    text = "\n".join(lines) + ("\n" if final_newline else "")
+    if path.suffix == ".gz":
+        with gzip.open(path, "wt") as f:
+            f.write(text)
+    else:
+        path.write_text(text)
+    return str(path)
+
+
+def _ts(lines: list[str], i: int) -> datetime:
+    return datetime.fromisoformat(lines[i].split(" ", 1)[0])
+
+
+@pytest.fixture(scope="module")
+def logs(tmp_path_factory: pytest.TempPathFactory) -> dict[str, list[str]]:
+    tmp = tmp_path_factory.mktemp("logs")
+    lines = _log_lines()
+    return {
+        "plain": [_write(tmp / "packet.log", lines)],
+        "rotated": [
+            _write(tmp / "packet.log.1.gz", lines[:150]),
+            _write(tmp / "rotated.log", lines[150:]),
+        ],
+        "no final newline": [_write(tmp / "open.log", lines, final_newline=False)],
+    }
+
+
+@pytest.mark.parametrize("name", ["plain", "rotated", "no final newline"])
+@pytest.mark.parametrize("span", [(None, None), (20, 250), (101, None), (None, 3)])
+def test_parallel_decode_is_sequential_decode(
+    logs: dict[str, list[str]], name: str, span: tuple[int | None, int | None]
+) -> None:
+    lines = _log_lines()
+    since, until = (None if i is None else _ts(lines, i) for i in span)
+    sequential = "\n".join(decode_log(logs[name], since, until))
+    assert sequential
+    for chunk_size in (1, 200, 4096):
+        parallel = decode_log(logs[name], since, until, jobs=2, chunk_size=chunk_size)
+        assert "\n".join(parallel) == sequential, chunk_size
+
+
+def test_rf_repeats_are_skipped(logs: dict[str, list[str]]) -> None:
+    """Lines 3k+1 and 3k+2 repeat line 3k, the chunks of 1 byte are single lines"""
+    output = list(decode_log(logs["plain"], jobs=2, chunk_size=1))
+    # 100 line 3k packets, line 100 (99 has another frame) and the junk line
+    assert len(output) == 102
+    assert "not a packet" in output
+
+
+def _fields(text: str) -> dict[str, str]:
+    """The packet fields of a line of text output, or of the frame of an error"""
+    if text.startswith("!!! "):
+        text = text.rsplit(": ", 1)[1]
+    ts, rssi, verb, src, dst, _ann, code = [t for t in text.split() if t != "---"][:7]
+    return {"ts": ts, "rssi": rssi, "verb": verb, "src": src, "dst": dst, "code": code}
+
+
+@pytest.mark.parametrize(
+    ("packet_filter", "selected"),
+    [
+        (
+            PacketFilter(codes=frozenset({"31D9", "12A0"})),
+            lambda f: f["code"] in {"31D9", "12A0"},
+        ),
+        (PacketFilter(src=frozenset({"29:099029"})), lambda f: f["src"] == "29:099029"),
+        (PacketFilter(dst=frozenset({"29:224547"})), lambda f: f["dst"] == "29:224547"),
+        (PacketFilter(verbs=frozenset({"I"})), lambda f: f["verb"] == "I"),
+        (
+            PacketFilter(verbs=frozenset({"RQ", "RP"})),
+            lambda f: f["verb"] in {"RQ", "RP"},
+        ),
+        (PacketFilter(min_rssi=-50), lambda f: -int(f["rssi"]) >= -50),
+        (
+            PacketFilter(codes=frozenset({"12A0"}), verbs=frozenset({"RP"})),
+            lambda f: f["code"] == "12A0" and f["verb"] == "RP",
+        ),
+    ],
+)
+@pytest.mark.parametrize("repeats", [False, True])
+def test_filter_selects_from_the_unfiltered_decode(
+    logs: dict[str, list[str]],
+    packet_filter: PacketFilter,
+    selected: Callable[[dict[str, str]], bool],
+    repeats: bool,
+) -> None:
+    unfiltered = list(decode_log(logs["plain"], repeats=repeats))
+    expected = [
+        text
+        for text in unfiltered
+        if text[:1].isdigit() or text.startswith("!!! ")
+        if selected(_fields(text))
+    ]
+    assert expected
+    filtered = decode_log(logs["plain"], packet_filter=packet_filter, repeats=repeats)
+    assert list(filtered) == expected
+
+
+def test_filter_off_the_fixed_layout() -> None:
+    """Frames not in the fixed layout are matched on the parsed packet, or reported"""
+    frame = FRAMES[0]
+    packet_filter = PacketFilter(codes=frozenset({"31D9"}), min_rssi=-70)
+    assert packet_filter.match(frame) is True
+    assert packet_filter.match(frame.replace(" 31D9", "31D9 ")) is None
+    assert packet_filter.match_packet(_packet(frame))
+    assert not packet_filter.match_packet(_packet(FRAMES[1]))
+    assert not PacketFilter(min_rssi=-70).match_packet(_packet(f"---{frame[3:]}"))
+
+    decoder = LogDecoder(packet_filter=packet_filter)
+    malformed = f"{TS} {frame.replace(' --- ', ' ---  ')}"
+    assert (decoder.decode(malformed) or "").startswith("!!! ")
+
+
+def test_jsonl_and_csv_are_the_text_decode(logs: dict[str, list[str]]) -> None:
+    texts = [t for t in decode_log(logs["plain"]) if t[:1].isdigit()]
+    records = [json.loads(r) for r in decode_log(logs["plain"], output="jsonl")]
+    rows = list(csv.DictReader(decode_log(logs["plain"], output="csv")))
+
+    errors = [r for r in records if "error" in r]
+    assert [r["ts"] for r in errors] == [r["ts"] for r in rows if r["error"]]
+    records = [r for r in records if "error" not in r]
+    rows = [r for r in rows if not r["error"]]
+    assert len(texts) == len(records) == len(rows)
+    for text, record, row in zip(texts, records, rows, strict=True):
+        fields = _fields(text)
+        assert record["ts"] == row["ts"] == fields["ts"]
+        assert record["signal_strength"] == int(row["signal_strength"])
+        assert record["signal_strength"] == -int(fields["rssi"])  # dBm
+        for key in ("verb", "src", "dst", "code"):
+            assert record[key] == row[key] == fields[key]
+        for name, value in record["values"].items():
+            assert row[name] == ("" if value is None else str(value)), name
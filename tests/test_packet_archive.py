@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import time
+from collections.abc import Iterator
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from custom_components.orcon_mvs15.packet_analytics import load
+from custom_components.orcon_mvs15.packet_archive import PacketArchive, convert
+from custom_components.orcon_mvs15.packet_log import _line_ns, read_lines
+
+FRAMES = [
+    "064  I --- 29:224547 --:------ 29:224547 31D9 003 000004",
+    "060  I --- 29:099029 --:------ 29:099029 1298 003 00049E",
+    "044 RP --- 29:224547 18:149960 --:------ 12A0 002 002F",
+]
+# RAMSES_ESP lines have a UTC offset, ramses_rf lines are local time, both in
+# summer and winter time
+OURS = [
+    f"2025-06-01T17:10:49.271376+02:00 {FRAMES[0]}",
+    f"2025-06-01T17:11:00.500000+02:00 {FRAMES[1]}",
+    f"2025-01-15T08:00:00.000001+01:00 {FRAMES[2]}",
+]
+RAMSES_RF = [
+    f"2025-06-01T17:12:00.123456 {FRAMES[2]}",
+    f"2025-01-15T08:01:00.654321 {FRAMES[0]}",
+    # not the fixed width layout, parsed the slow way
+    f"2025-06-01T17:13:00.000002  {FRAMES[1]}",
+]
+
+
+@pytest.fixture
+def amsterdam(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    monkeypatch.setenv("TZ", "Europe/Amsterdam")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def _ns(line: str) -> int:
+    ns = _line_ns(line)
+    assert ns is not None
+    return ns
+
+
+def _dump(path: Path) -> list[str]:
+    with PacketArchive(str(path)) as archive:
+        return [f"{e['ts']} {e['msg']}" for e in archive.envelopes()]
+
+
+def test_round_trip(tmp_path: Path, amsterdam: None) -> None:
+    log = tmp_path / "packet.log"
+    log.write_text("\n".join(OURS + RAMSES_RF) + "\n")
+    assert convert([str(log)], str(tmp_path / "packet.rpa")) == 6
+    expected = OURS + [
+        f"2025-06-01T17:12:00.123456+02:00 {FRAMES[2]}",
+        f"2025-01-15T08:01:00.654321+01:00 {FRAMES[0]}",
+        f"2025-06-01T17:13:00.000002+02:00 {FRAMES[1]}",
+    ]
+    assert _dump(tmp_path / "packet.rpa") == sorted(expected, key=_ns)
+
+
+def test_same_time_as_the_time_index(tmp_path: Path, amsterdam: None) -> None:
+    """Analytics, the archive and --since agree on the time of a line"""
+    log = tmp_path / "packet.log"
+    log.write_text("\n".join(OURS + RAMSES_RF) + "\n")
+    table = load(str(log))
+    assert sorted(table.packets["ts"].tolist()) == sorted(
+        _ns(line) for line in OURS + RAMSES_RF
+    )
+
+    since = datetime.fromisoformat("2025-06-01T17:11:30")
+    convert([str(log)], str(tmp_path / "packet.rpa"))
+    with PacketArchive(str(tmp_path / "packet.rpa")) as archive:
+        archived = [e["msg"] for e in archive.envelopes(since=since)]
+    assert archived == [
+        line.split(" ", 1)[1].lstrip() for line in read_lines([str(log)], since)
+    ]
+    assert archived == [FRAMES[2], FRAMES[1]]
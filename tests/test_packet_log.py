@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+
+import pytest
+
+from custom_components.orcon_mvs15.packet_log import PacketLog
+
+LINE = "2025-06-01T17:10:49.271376+02:00 062  I --- 29:224547 --:------ 29:224547 31D9 003 000004"
+
+
+def test_close_with_a_full_queue_does_not_block(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """The writer thread is behind, close() returns and it still writes everything"""
+    path = str(tmp_path / "packet.log")
+    log = PacketLog.open(path, max_queued=2, flush_size=1)
+    writing = threading.Event()
+    resume = threading.Event()
+    write_text = log._write_text
+
+    def stalled(batch: list[str], size: int) -> None:
+        writing.set()
+        resume.wait()
+        write_text(batch, size)
+
+    monkeypatch.setattr(log, "_write_text", stalled)
+    log.write(LINE)
+    assert writing.wait(5)
+    for _ in range(2):
+        log.write(LINE)
+    assert log._queue.full()
+
+    closing = threading.Thread(target=log.close)  # a blocking close fails, not hangs
+    closing.start()
+    closing.join(0.5)
+    closed = not closing.is_alive()
+    resume.set()
+    assert closed
+    log._thread.join(5)
+    assert not log._thread.is_alive()
+    assert Path(path).read_text() == f"{LINE}\n" * 3
+    assert log.dropped == 0
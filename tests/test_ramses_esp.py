@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import pytest
+from homeassistant.components.mqtt import ReceiveMessage
+from homeassistant.core import HomeAssistant
+
+from custom_components.orcon_mvs15.codes import Code31d9
+from custom_components.orcon_mvs15.ramses_esp import RamsesESP
+from custom_components.orcon_mvs15.ramses_packet import RamsesID
+from custom_components.orcon_mvs15.replay import ReplayMQTT
+
+GATEWAY = RamsesID("18:149960")
+FAN = RamsesID("29:224547")
+
+
+@asynccontextmanager
+async def _ramses_esp(config_dir: Path) -> AsyncIterator[tuple[RamsesESP, ReplayMQTT]]:
+    """RamsesESP on a bare Home Assistant core, published packets go to mqtt.published"""
+    hass = HomeAssistant(str(config_dir))
+    mqtt = ReplayMQTT(hass, GATEWAY)
+    await mqtt.init()
+    esp = RamsesESP(
+        hass,
+        mqtt,
+        remote_id=RamsesID("29:163058"),
+        fan_id=FAN,
+        co2_id=RamsesID("29:099029"),
+        gateway_id=GATEWAY,
+        packet_log_path=str(config_dir / "packet.log"),
+    )
+    await mqtt.setup(
+        esp.handle_ramses_mqtt_message, esp.handle_ramses_mqtt_version_message
+    )
+    try:
+        yield esp, mqtt
+    finally:
+        esp.cleanup()
+        mqtt.cleanup()
+        await hass.async_stop(force=True)
+
+
+def test_malformed_message_is_a_warning(
+    tmp_path: Path, caplog: pytest.LogCaptureFixture
+) -> None:
+    """Without a traceback, those are a fact of RF life"""
+
+    async def receive() -> RamsesESP:
+        async with _ramses_esp(tmp_path) as (esp, mqtt):
+            await esp.handle_ramses_mqtt_message(
+                ReceiveMessage(
+                    topic=mqtt.sub_topic,
+                    payload='{"ts": "2025-06-01T17:10:49.271376+02:00", "msg"',
+                    qos=0,
+                    retain=False,
+                    subscribed_topic=mqtt.sub_topic,
+                    timestamp=time.monotonic(),
+                )
+            )
+            return esp
+
+    with caplog.at_level(logging.WARNING):
+        esp = asyncio.run(receive())
+    assert esp.stats["malformed"] == 1
+    [record] = caplog.records
+    assert record.levelno == logging.WARNING
+    assert record.exc_info is None
+
+
+async def _transmitted(mqtt: ReplayMQTT, count: int) -> list[str]:
+    """Frames of the first count packets sent, retries come seconds later"""
+    for _ in range(100):
+        if len(mqtt.published) >= count:
+            break
+        await asyncio.sleep(0.05)
+    return [envelope["msg"] for envelope in mqtt.published]
+
+
+def test_commands_are_not_coalesced(tmp_path: Path) -> None:
+    """High, Low, High while the first High waits for its 31D9 ends on High"""
+
+    async def command() -> tuple[list[str], int]:
+        async with _ramses_esp(tmp_path) as (esp, mqtt):
+            for mode in ("High", "Low", "High"):
+                await esp.set_preset_mode(mode)
+            return await _transmitted(mqtt, 3), esp.stats["coalesced"]
+
+    frames, coalesced = asyncio.run(command())
+    assert [frame.split()[-1] for frame in frames] == ["000304", "000104", "000304"]
+    assert coalesced == 0
+
+
+def test_identical_requests_are_coalesced(tmp_path: Path) -> None:
+    async def request() -> tuple[list[str], int]:
+        async with _ramses_esp(tmp_path) as (esp, mqtt):
+            for _ in range(2):
+                await esp.publish(Code31d9.get(src_id=GATEWAY, dst_id=FAN))
+            await asyncio.sleep(0.5)  # longer than the gap between transmissions
+            return await _transmitted(mqtt, 1), esp.stats["coalesced"]
+
+    frames, coalesced = asyncio.run(request())
+    assert len(frames) == 1
+    assert coalesced == 1